@@ -0,0 +1,19 @@
+"""Micro-benchmarks, run from the project directory, e.g.
+
+    python -m benchmarks.smtp_pool
+
+They configure Django themselves and never touch the project database,
+except benchmarks.load with --target, which has to share the server's.
+"""
+import os
+
+
+def setup_django(**overrides):
+    """Configure Django with the project settings plus the given overrides"""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "securefiles.settings")
+    import django
+    from django.conf import settings
+
+    django.setup()
+    for name, value in overrides.items():
+        setattr(settings, name, value)
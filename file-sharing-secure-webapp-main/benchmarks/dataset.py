@@ -0,0 +1,106 @@
+"""Synthetic users, API tokens and files for the load benchmark.
+
+Every object is named with a prefix so a dataset can be removed again from a
+shared database. File contents are small valid .xlsx packages padded with
+seeded random bytes: the same seed gives the same files, and no two files of
+one dataset share a blob.
+"""
+from files.synthetic import ooxml_document
+
+import hashlib
+import uuid
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+class Dataset:
+    def __init__(self, prefix, ops_token, clients, file_ids):
+        self.prefix = prefix
+        self.ops_token = ops_token
+        # (user id, email, API token) of each client user
+        self.clients = clients
+        self.file_ids = file_ids
+
+    def client(self, i):
+        return self.clients[i % len(self.clients)]
+
+    def file_id(self, i):
+        return self.file_ids[i % len(self.file_ids)]
+
+
+def store_file(uploader, name, content):
+    """Record content as an upload by uploader, as FileUploadView would"""
+    from files.models import UploadedFile
+    from files.storage import blob_storage
+    from files.upload_handlers import StagedUploadedFile
+
+    path, staged = blob_storage.create_staging_file()
+    with staged:
+        staged.write(content)
+    upload = StagedUploadedFile(
+        path, name, XLSX_CONTENT_TYPE, len(content), None, None, hashlib.sha256(content).hexdigest()
+    )
+    return UploadedFile.objects.create_from_upload(uploader, upload, secure_token=str(uuid.uuid4()))
+
+
+def build_dataset(prefix, users, files, sizes, seed):
+    """Create one ops user, users client users with API tokens and files uploaded by the ops user.
+
+    File i has size sizes[i % len(sizes)].
+    """
+    from django.contrib.auth.hashers import make_password
+    from rest_framework.authtoken.models import Token
+    from users.models import CustomUser, normalize_email_address
+
+    def new_user(name, **flags):
+        email = f"{name}@bench.example.com"
+        # bulk_create() skips save(), which is what normally fills email_normalized
+        return CustomUser(
+            username=name,
+            email=email,
+            email_normalized=normalize_email_address(email),
+            email_verified=True,
+            password=make_password(None),
+            **flags,
+        )
+
+    CustomUser.objects.bulk_create(
+        [new_user(f"{prefix}ops", is_ops=True)]
+        + [new_user(f"{prefix}client{i}", is_client=True) for i in range(users)]
+    )
+    created = {user.username: user for user in CustomUser.objects.filter(username__startswith=prefix)}
+    tokens = {user.pk: Token.generate_key() for user in created.values()}
+    Token.objects.bulk_create([Token(user_id=user_id, key=key) for user_id, key in tokens.items()])
+
+    ops = created[f"{prefix}ops"]
+    clients = [
+        (user.pk, user.email, tokens[user.pk])
+        for user in (created[f"{prefix}client{i}"] for i in range(users))
+    ]
+    file_ids = [
+        store_file(ops, f"{prefix}file{i}.xlsx", ooxml_document(sizes[i % len(sizes)], f"{seed}:file:{i}")).pk
+        for i in range(files)
+    ]
+    return Dataset(prefix, tokens[ops.pk], clients, file_ids)
+
+
+def delete_dataset(prefix):
+    """Delete the users named with prefix, their files, and blobs no other file references"""
+    from django.db import transaction
+    from files.models import Blob, UploadedFile
+    from files.storage import blob_storage
+    from users.models import CustomUser
+
+    users = CustomUser.objects.filter(username__startswith=prefix)
+    hashes = set(UploadedFile.objects.filter(uploader__in=users).values_list("sha256", flat=True))
+    # Deleting the files releases their blob references (see files.signals)
+    users.delete()
+
+    for sha256 in hashes:
+        with transaction.atomic():
+            blob = Blob.objects.select_for_update().filter(pk=sha256, ref_count=0).first()
+            if blob is None or UploadedFile.objects.filter(blob=blob).exists():
+                continue
+            blob.delete()
+            name = blob_storage.blob_name(sha256)
+            transaction.on_commit(lambda name=name: blob_storage.delete(name))
@@ -0,0 +1,85 @@
+"""Cost of rendering the magic-login email, per message.
+
+Compares compiling the templates on every send (a loader without caching),
+two render_to_string() calls through the cached loader, and
+users.email_rendering.render_email(), which renders both parts from one
+Context with precompiled templates.
+
+    python -m benchmarks.email_render --messages 5000
+"""
+from . import setup_django
+
+import argparse
+import time
+
+
+def build_contexts(count):
+    from users.models import CustomUser
+
+    return [
+        {
+            "user": CustomUser(username=f"user{i}", first_name="Test", last_name=f"User {i}"),
+            "magic_link": f"https://files.example.com/magic-login/{i:032x}/",
+            "login_time": "October 18, 2026 at 10:30 AM",
+            "user_ip": "203.0.113.7",
+            "user_agent": "Mozilla/5.0 (X11; Linux x86_64) <benchmark>",
+        }
+        for i in range(count)
+    ]
+
+
+def bench_uncached(contexts):
+    from django.conf import settings
+    from django.template import Context, Engine
+
+    # What every send costs when the cached loader is not in use
+    engine = Engine(dirs=[str(settings.BASE_DIR / "templates")], loaders=["django.template.loaders.filesystem.Loader"])
+    start = time.perf_counter()
+    for context in contexts:
+        engine.get_template("emails/magic_login.html").render(Context(context))
+        engine.get_template("emails/magic_login.txt").render(Context(context))
+    return time.perf_counter() - start
+
+
+def bench_render_to_string(contexts):
+    from django.template.loader import render_to_string
+
+    start = time.perf_counter()
+    for context in contexts:
+        render_to_string("emails/magic_login.html", context)
+        render_to_string("emails/magic_login.txt", context)
+    return time.perf_counter() - start
+
+
+def bench_render_email(contexts):
+    from users.email_rendering import render_email
+
+    start = time.perf_counter()
+    for context in contexts:
+        render_email("magic_login", context)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000)
+    args = parser.parse_args()
+
+    setup_django()
+    contexts = build_contexts(args.messages)
+    # Warm the cached loader so only steady-state rendering is timed
+    bench_render_to_string(contexts[:1])
+    bench_render_email(contexts[:1])
+
+    results = [
+        ("compile on every send", bench_uncached(contexts)),
+        ("render_to_string x2, cached", bench_render_to_string(contexts)),
+        ("render_email", bench_render_email(contexts)),
+    ]
+    print(f"{args.messages} messages")
+    for name, elapsed in results:
+        print(f"  {name:<30} {elapsed:8.3f}s  {elapsed / args.messages * 1e6:8.1f} us/message")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,457 @@
+"""Load benchmark for the upload, list, link, download and magic-login paths.
+
+Builds a dataset of --users client users and --files files (sizes cycling
+through --file-sizes), then times --requests requests per scenario:
+
+    upload         POST /api/upload/                 (FileUploadView)
+    list           GET  /api/list/                   (FileListView)
+    link           GET  /api/download-file/<id>/     (FileDownloadLinkView)
+    download       GET  /api/secure-download/<token>/ (SecureDownloadView)
+    magic_request  POST /request-magic-login/
+    magic_login    GET  /magic-login/<token>/
+
+By default requests go through Django's test client in this process, against
+a throwaway test database and a temporary media directory, one at a time:
+
+    python -m benchmarks.load --users 50 --files 200 --file-sizes 16k,1m --output baseline.json
+
+With --target they are sent over HTTP, --concurrency at a time, to a server
+running from this checkout, e.g. ``gunicorn -c securefiles/gunicorn.conf.py
+securefiles.wsgi`` or ``uvicorn securefiles.asgi:application``. The dataset
+is then written to the database configured by the environment, which must be
+the server's, and deleted afterwards unless --keep is given. Start the server
+with RATE_LIMIT_ENABLED=False, and with a shared cache (REDIS_URL) if
+MAGIC_TOKEN_STORE is the cache store, as magic_login tokens are issued here.
+Use PostgreSQL for concurrent runs, as SQLite fails writes under contention,
+and at least as many --users as --concurrency, as issuing a magic token
+retires the user's previous one:
+
+    python -m benchmarks.load --target http://127.0.0.1:8000 --concurrency 8 --server-pid 4242
+
+Each scenario reports p50/p95/p99 latency, throughput and the peak RSS of
+this process (and of --server-pid processes, read from /proc). --output saves
+the results with the commit they were measured on; --compare diffs them
+against a saved baseline and exits with status 1 if a latency grew, or the
+throughput fell, by more than --threshold percent:
+
+    python -m benchmarks.load --compare baseline.json --output current.json
+    python -m benchmarks.load --compare baseline.json --current current.json
+"""
+from . import setup_django
+from .dataset import XLSX_CONTENT_TYPE, build_dataset, delete_dataset
+from files.synthetic import ooxml_document, parse_size
+
+import argparse
+import datetime
+import http.client
+import json
+import math
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+SCENARIOS = ("upload", "list", "link", "download", "magic_request", "magic_login")
+
+# Metrics compared by --compare, and whether a higher value is better
+COMPARED_METRICS = (("p50_ms", False), ("p95_ms", False), ("p99_ms", False), ("throughput_rps", True))
+
+
+class Response:
+    def __init__(self, status, body, location=None):
+        self.status = status
+        self.body = body
+        self.location = location
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class InProcessClient:
+    """Sends requests through Django's test client; cookies are not kept between requests"""
+
+    def request(self, method, path, token=None, fields=None, files=None):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from django.test import Client
+
+        headers = {"Authorization": f"Token {token}"} if token else {}
+        data = dict(fields or {})
+        for field, (name, content, content_type) in (files or {}).items():
+            data[field] = SimpleUploadedFile(name, content, content_type=content_type)
+
+        client = Client()
+        if method == "GET":
+            response = client.get(path, headers=headers)
+        else:
+            response = client.post(path, data, headers=headers)
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return Response(response.status_code, body, response.get("Location"))
+
+
+class HTTPClient:
+    """Sends requests over one keep-alive connection per thread"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self.netloc = parts.netloc
+        self.local = threading.local()
+        self.csrf_token = None
+        self.csrf_lock = threading.Lock()
+
+    def connection(self):
+        if getattr(self.local, "connection", None) is None:
+            self.local.connection = self.connection_class(self.netloc, timeout=60)
+        return self.local.connection
+
+    def get_csrf_token(self):
+        """CSRF cookie for the HTML form views, fetched once from the magic-link page"""
+        with self.csrf_lock:
+            if self.csrf_token is None:
+                connection = self.connection_class(self.netloc, timeout=60)
+                connection.request("GET", "/request-magic-login/")
+                response = connection.getresponse()
+                response.read()
+                connection.close()
+                for header in response.headers.get_all("Set-Cookie") or []:
+                    name, _, value = header.split(";", 1)[0].partition("=")
+                    if name.strip() == "csrftoken":
+                        self.csrf_token = value
+                if self.csrf_token is None:
+                    raise RuntimeError("The server did not set a csrftoken cookie")
+            return self.csrf_token
+
+    def request(self, method, path, token=None, fields=None, files=None):
+        headers = {}
+        if token:
+            headers["Authorization"] = f"Token {token}"
+        body = None
+        if method == "POST":
+            fields = dict(fields or {})
+            if not token:
+                csrf_token = self.get_csrf_token()
+                fields["csrfmiddlewaretoken"] = csrf_token
+                headers["Cookie"] = f"csrftoken={csrf_token}"
+            if files:
+                body, headers["Content-Type"] = encode_multipart(fields, files)
+            else:
+                body = urlencode(fields).encode()
+                headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+        # A kept-alive connection may have been closed by the server; reconnect once
+        for attempt in range(2):
+            connection = self.connection()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                content = response.read()
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                self.local.connection = None
+                if attempt:
+                    raise
+                continue
+            return Response(response.status, content, response.getheader("Location"))
+
+
+def encode_multipart(fields, files):
+    """Return a multipart/form-data body and its Content-Type"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        )
+    for name, (filename, content, content_type) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n".encode()
+            + content
+            + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+class Benchmark:
+    def __init__(self, client, dataset, args):
+        self.client = client
+        self.dataset = dataset
+        self.args = args
+        self.upload_sizes = [parse_size(size) for size in args.upload_sizes.split(",")]
+
+    # Each scenario does any untimed preparation for request i, then returns
+    # a callable that sends the timed request and returns whether it succeeded
+
+    def upload(self, i):
+        content = ooxml_document(self.upload_sizes[i % len(self.upload_sizes)], f"{self.args.seed}:upload:{i}")
+        files = {"file": (f"{self.dataset.prefix}upload{i}.xlsx", content, XLSX_CONTENT_TYPE)}
+        return lambda: self.client.request(
+            "POST", "/api/upload/", token=self.dataset.ops_token, files=files
+        ).status == 200
+
+    def list(self, i):
+        _, _, token = self.dataset.client(i)
+        return lambda: self.client.request("GET", "/api/list/?page_size=50", token=token).status == 200
+
+    def link(self, i):
+        _, _, token = self.dataset.client(i)
+        path = f"/api/download-file/{self.dataset.file_id(i)}/"
+        return lambda: self.client.request("GET", path, token=token).status == 200
+
+    def download(self, i):
+        _, _, token = self.dataset.client(i)
+        response = self.client.request("GET", f"/api/download-file/{self.dataset.file_id(i)}/", token=token)
+        if response.status != 200:
+            return lambda: False
+        path = urlsplit(response.json()["download-link"]).path
+        return lambda: self.client.request("GET", path, token=token).status == 200
+
+    def magic_request(self, i):
+        _, email, _ = self.dataset.client(i)
+        # The page is rendered whether or not the email was queued; a 200 is all there is to check
+        return lambda: self.client.request("POST", "/request-magic-login/", fields={"email": email}).status == 200
+
+    def magic_login(self, i):
+        from users.models import CustomUser
+        from users.token_stores import get_token_store
+
+        user_id, _, _ = self.dataset.client(i)
+        token = get_token_store().create(CustomUser(pk=user_id), "127.0.0.1", "benchmarks.load").token
+
+        def request():
+            response = self.client.request("GET", f"/magic-login/{token}/")
+            # Failures redirect home, successes to the dashboard
+            return response.status == 302 and "dashboard" in (response.location or "")
+        return request
+
+    def run(self, name):
+        scenario = getattr(self, name)
+        for i in range(self.args.warmup):
+            scenario(-1 - i)()
+
+        latencies = []
+        errors = 0
+        lock = threading.Lock()
+
+        def one(i):
+            nonlocal errors
+            request = scenario(i)
+            start = time.perf_counter()
+            try:
+                ok = request()
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                errors += not ok
+
+        if self.args.concurrency == 1:
+            for i in range(self.args.requests):
+                one(i)
+        else:
+            with ThreadPoolExecutor(max_workers=self.args.concurrency) as executor:
+                list(executor.map(one, range(self.args.requests)))
+        return summarize(latencies, errors, self.args.concurrency)
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted values"""
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+
+def summarize(latencies, errors, concurrency):
+    latencies = sorted(latencies)
+    mean = sum(latencies) / len(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "mean_ms": round(mean * 1000, 3),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+        # Little's law with every worker busy; unlike wall time this leaves out
+        # the untimed preparation (building upload bodies, fetching links, ...)
+        "throughput_rps": round(concurrency / mean, 2),
+        "peak_rss_bytes": own_peak_rss(),
+    }
+
+
+def own_peak_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def process_peak_rss(pid):
+    """Peak RSS in bytes of another process, or None where /proc is not available"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def current_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if dirty else commit
+
+
+def run_in_process(args):
+    media_root = tempfile.mkdtemp(prefix="bench-media-")
+    setup_django(
+        MEDIA_ROOT=media_root,
+        RESUMABLE_UPLOAD_DIR=os.path.join(media_root, "upload_sessions"),
+        RATE_LIMIT_ENABLED=False,
+    )
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    # DEBUG off, so queries are not logged, and mail goes to the locmem backend
+    setup_test_environment(debug=False)
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        dataset = build_dataset("bench-", args.users, args.files, args.file_sizes, args.seed)
+        return run_scenarios(Benchmark(InProcessClient(), dataset, args), args)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        shutil.rmtree(media_root, ignore_errors=True)
+
+
+def run_http(args):
+    setup_django()
+    prefix = "bench-"
+    # Left over from a run with --keep
+    delete_dataset(prefix)
+    dataset = build_dataset(prefix, args.users, args.files, args.file_sizes, args.seed)
+    try:
+        results = run_scenarios(Benchmark(HTTPClient(args.target), dataset, args), args)
+    finally:
+        if not args.keep:
+            delete_dataset(prefix)
+    results["server_peak_rss_bytes"] = {str(pid): process_peak_rss(pid) for pid in args.server_pid}
+    return results
+
+
+def run_scenarios(benchmark, args):
+    results = {}
+    for name in args.scenarios:
+        results[name] = benchmark.run(name)
+        print_summary(name, results[name])
+    return {"scenarios": results}
+
+
+def print_summary(name, summary):
+    print(
+        f"{name:<14} p50 {summary['p50_ms']:9.2f} ms  p95 {summary['p95_ms']:9.2f} ms  "
+        f"p99 {summary['p99_ms']:9.2f} ms  {summary['throughput_rps']:9.1f} req/s  "
+        f"rss {summary['peak_rss_bytes'] / 2 ** 20:7.1f} MiB  errors {summary['errors']}"
+    )
+
+
+def compare(baseline, current, threshold):
+    """Print the change of each compared metric; return whether any regressed beyond threshold percent"""
+    regressed = False
+    print(f"{'scenario':<14} {'metric':<15} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, summary in current["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if base is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS:
+            before, after = base[metric], summary[metric]
+            change = (after - before) / before * 100 if before else 0.0
+            worse = -change if higher_is_better else change
+            flag = ""
+            if worse > threshold:
+                regressed = True
+                flag = "  REGRESSION"
+            print(f"{name:<14} {metric:<15} {before:>10.2f} {after:>10.2f} {change:>+7.1f}%{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="client users to create")
+    parser.add_argument("--files", type=int, default=100, help="files to create")
+    parser.add_argument("--file-sizes", default="16k,256k", help="sizes of the created files, cycled")
+    parser.add_argument("--upload-sizes", default="64k", help="sizes of the uploaded files, cycled")
+    parser.add_argument("--requests", type=int, default=200, help="timed requests per scenario")
+    parser.add_argument("--warmup", type=int, default=10, help="untimed requests per scenario")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--seed", default="0", help="seed for file contents")
+    parser.add_argument("--target", help="base URL of a running server; default is in-process")
+    parser.add_argument("--concurrency", type=int, default=1, help="requests in flight (--target only)")
+    parser.add_argument("--server-pid", type=int, action="append", default=[],
+                        help="server process whose peak RSS to report; repeatable")
+    parser.add_argument("--keep", action="store_true", help="leave the dataset in the database (--target only)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare the results with")
+    parser.add_argument("--current", help="compare this results file instead of running the benchmark")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed regression in percent")
+    args = parser.parse_args()
+
+    if args.current:
+        if not args.compare:
+            parser.error("--current needs --compare")
+        with open(args.compare) as baseline, open(args.current) as current:
+            sys.exit(1 if compare(json.load(baseline), json.load(current), args.threshold) else 0)
+
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    if args.users < 1 or args.files < 1:
+        parser.error("--users and --files must be at least 1")
+    if args.concurrency > 1 and not args.target:
+        # The test client and the test database are not meant to be shared between threads
+        parser.error("--concurrency needs --target")
+    args.file_sizes = [parse_size(size) for size in args.file_sizes.split(",")]
+
+    results = run_http(args) if args.target else run_in_process(args)
+    results.update({
+        "commit": current_commit(),
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "target": args.target or "in-process",
+        "python": sys.version.split()[0],
+        "params": {
+            "users": args.users,
+            "files": args.files,
+            "file_sizes": args.file_sizes,
+            "upload_sizes": args.upload_sizes,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+        },
+    })
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+            output.write("\n")
+    if args.compare:
+        with open(args.compare) as baseline:
+            sys.exit(1 if compare(json.load(baseline), results, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Throughput of per-message SMTP sessions versus PooledSMTPBackend.
+
+Starts a local SMTP sink that accepts and discards mail, optionally adding a
+delay to each connection (standing in for TCP + TLS + AUTH) and to each
+command (standing in for network round trips), then sends the same messages
+with Django's SMTP backend, one connection per message as send_mail() does,
+and with PooledSMTPBackend.send_batch().
+
+    python -m benchmarks.smtp_pool --messages 200 --connect-delay 0.05 --command-delay 0.002
+"""
+from . import setup_django
+
+import argparse
+import socketserver
+import threading
+import time
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: greet, accept every command, swallow DATA"""
+
+    def reply(self, line):
+        time.sleep(self.server.command_delay)
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        time.sleep(self.server.connect_delay)
+        self.reply("220 localhost benchmark sink")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].decode(errors="replace").upper()
+            if command == "EHLO":
+                self.reply("250-localhost")
+                self.reply("250 8BITMIME")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                with self.server.lock:
+                    self.server.received += 1
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, connect_delay=0.0, command_delay=0.0):
+        super().__init__(("127.0.0.1", 0), SMTPSinkHandler)
+        self.connect_delay = connect_delay
+        self.command_delay = command_delay
+        self.received = 0
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+def build_messages(count):
+    from django.core.mail import EmailMultiAlternatives
+
+    messages = []
+    for i in range(count):
+        message = EmailMultiAlternatives(
+            subject=f"Benchmark message {i}",
+            body="Your verification link: http://localhost/magic-login/x/",
+            from_email="bench@localhost",
+            to=[f"user{i}@localhost"],
+        )
+        message.attach_alternative("<p>Your verification link</p>", "text/html")
+        messages.append(message)
+    return messages
+
+
+def bench_per_message(messages):
+    from django.core.mail.backends.smtp import EmailBackend
+
+    start = time.perf_counter()
+    for message in messages:
+        # What send_mail() does: a new backend, and so a new session, per call
+        EmailBackend(fail_silently=False).send_messages([message])
+    return time.perf_counter() - start
+
+
+def bench_pooled(messages):
+    from users.email_backends import PooledSMTPBackend
+
+    backend = PooledSMTPBackend(fail_silently=False)
+    start = time.perf_counter()
+    errors = backend.send_batch(messages)
+    elapsed = time.perf_counter() - start
+    PooledSMTPBackend.close_pools()
+    failed = sum(error is not None for error in errors)
+    if failed:
+        raise SystemExit(f"{failed} messages failed, e.g. {next(e for e in errors if e)!r}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--connect-delay", type=float, default=0.05, help="seconds added per connection")
+    parser.add_argument("--command-delay", type=float, default=0.001, help="seconds added per SMTP reply")
+    args = parser.parse_args()
+
+    sink = SMTPSink(args.connect_delay, args.command_delay)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+    setup_django(
+        EMAIL_HOST="127.0.0.1",
+        EMAIL_PORT=sink.port,
+        EMAIL_HOST_USER="",
+        EMAIL_HOST_PASSWORD="",
+        EMAIL_USE_TLS=False,
+        EMAIL_USE_SSL=False,
+        EMAIL_POOL_SIZE=args.pool_size,
+    )
+
+    messages = build_messages(args.messages)
+    results = [
+        ("per-message sessions", bench_per_message(messages)),
+        (f"pooled, {args.pool_size} connections", bench_pooled(messages)),
+    ]
+    sink.shutdown()
+
+    print(f"{args.messages} messages, connect delay {args.connect_delay}s, command delay {args.command_delay}s")
+    for name, elapsed in results:
+        print(f"  {name:<28} {elapsed:8.3f}s  {args.messages / elapsed:8.1f} msg/s")
+    print(f"  sink received {sink.received} messages")
+
+
+if __name__ == "__main__":
+    main()
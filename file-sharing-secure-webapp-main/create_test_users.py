@@ -0,0 +1,22 @@
+"""Create a few ops and client users with API tokens and some small Office files.
+
+Extra arguments are passed on to ``manage.py generate_test_data``, which can
+also build production-sized datasets; see its --help.
+"""
+import os
+import sys
+
+import django
+
+if __name__ == '__main__':
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'securefiles.settings')
+    django.setup()
+
+    from django.core.management import call_command
+
+    call_command(
+        'generate_test_data',
+        '--users', '5', '--ops-users', '2', '--files', '20',
+        '--content', 'ooxml', '--file-size', '16k', '--api-tokens', '--prefix', 'test',
+        *sys.argv[1:]
+    )
@@ -1,3 +1,10 @@
 from django.contrib import admin
+from .models import DownloadLinkRevocation
 
 # Register your models here.
+
+@admin.register(DownloadLinkRevocation)
+class DownloadLinkRevocationAdmin(admin.ModelAdmin):
+    list_display = ['file', 'revoked_at']
+    raw_id_fields = ['file']
+    ordering = ['-revoked_at']
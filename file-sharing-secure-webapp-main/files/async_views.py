@@ -0,0 +1,96 @@
+"""Async versions of the read-only file API views, served under ASGI.
+
+DRF's APIView is synchronous, so these are plain Django async views that
+reproduce the SessionAuthentication/CachedTokenAuthentication + IsClientUser checks
+of their counterparts in files.views with async ORM calls. Responses use the
+same status codes and bodies.
+"""
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views import View
+from monitoring.query_budget import query_budget
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from users.authentication import get_token_user
+
+from .downloads import build_download_response
+from .models import UploadedFile
+from .pagination import UploadedFileCursorPagination
+from .serializers import UploadedFileSerializer, FileListFilterSerializer
+from .signing import build_download_link, resolve_download_token
+
+
+async def authenticate(request):
+    """Return the user for a token or session, or None if the request is anonymous"""
+    auth = request.headers.get('Authorization', '').split()
+    if auth and auth[0].lower() == 'token':
+        if len(auth) != 2:
+            return None
+        return await sync_to_async(get_token_user)(auth[1])
+
+    user = await request.auser()
+    return user if user.is_authenticated else None
+
+
+class AsyncClientView(View):
+    """Base class for async views restricted to authenticated client users"""
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await authenticate(request)
+        if user is None:
+            # DRF answers 403 here too, as SessionAuthentication comes first
+            return JsonResponse({"detail": "Authentication credentials were not provided."}, status=403)
+        if not user.is_client:
+            return JsonResponse({"detail": "You do not have permission to perform this action."}, status=403)
+
+        request.user = user
+        return await super().dispatch(request, *args, **kwargs)
+
+
+@query_budget(3)
+class AsyncFileListView(AsyncClientView):
+    async def get(self, request):
+        # Wrap in a DRF request for query_params; nothing is parsed
+        drf_request = Request(request)
+        filters = FileListFilterSerializer(data=drf_request.query_params)
+        if not filters.is_valid():
+            return JsonResponse(filters.errors, status=400)
+
+        paginator = UploadedFileCursorPagination()
+        try:
+            files = await paginator.apaginate_queryset(
+                filters.filter_queryset(UploadedFile.objects.all()), drf_request, view=self
+            )
+        except ValidationError as error:
+            # A bad cursor; DRF's exception handler answers 400 in the sync view
+            return JsonResponse(error.detail, status=400)
+        return JsonResponse({
+            'next': paginator.get_next_link(),
+            'results': UploadedFileSerializer(files, many=True).data,
+        })
+
+
+@query_budget(3)
+class AsyncFileDownloadLinkView(AsyncClientView):
+    async def get(self, request, file_id):
+        if not await UploadedFile.objects.filter(id=file_id).aexists():
+            return JsonResponse({"error": "File not found"}, status=404)
+
+        link, expires_at = build_download_link(request, file_id)
+        return JsonResponse({
+            "download-link": link,
+            "expires_at": expires_at,
+            "message": "success"
+        })
+
+
+@query_budget(4)
+class AsyncSecureDownloadView(AsyncClientView):
+    async def get(self, request, token):
+        try:
+            # Usually answered from memory and the cache; may reload the revocation list
+            file = await sync_to_async(resolve_download_token)(token)
+        except UploadedFile.DoesNotExist:
+            return JsonResponse({"error": "Invalid or expired link"}, status=404)
+
+        return build_download_response(request, file, asynchronous=True)
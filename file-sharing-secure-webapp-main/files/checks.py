@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+import re
+
+# Key ids end at the first dot of a download token, so they cannot contain one
+KEY_ID = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+@register()
+def check_download_link_keys(app_configs, **kwargs):
+    errors = []
+    for key_id, secret in settings.DOWNLOAD_LINK_KEYS.items():
+        if not KEY_ID.match(key_id):
+            errors.append(Error(
+                f"DOWNLOAD_LINK_KEYS has an invalid key id {key_id!r}.",
+                hint='Use only letters, digits, "-" and "_", and write each key as "key-id:secret".',
+                id='files.E001',
+            ))
+        elif not secret:
+            errors.append(Error(f"DOWNLOAD_LINK_KEYS has no secret for key {key_id!r}.", id='files.E002'))
+    if settings.DOWNLOAD_LINK_KEY_ID not in settings.DOWNLOAD_LINK_KEYS:
+        errors.append(Error(
+            f"DOWNLOAD_LINK_KEY_ID {settings.DOWNLOAD_LINK_KEY_ID!r} is not one of DOWNLOAD_LINK_KEYS.",
+            id='files.E003',
+        ))
+    return errors
@@ -0,0 +1,252 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+from urllib.parse import quote
+
+import mimetypes
+import re
+import uuid
+
+DOWNLOAD_MODE_STREAM = 'stream'
+DOWNLOAD_MODE_X_ACCEL = 'x-accel-redirect'
+DOWNLOAD_MODE_X_SENDFILE = 'x-sendfile'
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# More ranges than this in one request is treated as abuse and answered in full
+MAX_RANGES = 16
+
+RANGE_SPEC_RE = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+
+def get_etag(uploaded_file):
+    """Strong ETag from the stored content hash, or None for files uploaded before hashing"""
+    if uploaded_file.sha256:
+        return f'"{uploaded_file.sha256}"'
+    return None
+
+
+def get_last_modified(uploaded_file):
+    """Files are never modified after upload, so the upload time is the modification time"""
+    return int(uploaded_file.uploaded_at.timestamp())
+
+
+def parse_range_header(header, size):
+    """Parse a Range header into a sorted list of inclusive (start, end) byte ranges.
+
+    Returns None when the header should be ignored (absent, malformed, not in
+    bytes or with too many ranges) and an empty list when no range can be
+    satisfied. Overlapping and adjacent ranges are coalesced.
+    """
+    if not header:
+        return None
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs:
+        return None
+
+    ranges = []
+    for spec in specs.split(','):
+        match = RANGE_SPEC_RE.match(spec)
+        if not match or match.groups() == ('', ''):
+            return None
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+            if last and end < start:
+                return None
+            if start >= size:
+                continue
+            ranges.append((start, min(end, size - 1)))
+        else:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length and size:
+                ranges.append((max(size - length, 0), size - 1))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    coalesced = []
+    for start, end in sorted(ranges):
+        if coalesced and start <= coalesced[-1][1] + 1:
+            coalesced[-1] = (coalesced[-1][0], max(end, coalesced[-1][1]))
+        else:
+            coalesced.append((start, end))
+    return coalesced
+
+
+def if_range_passes(request, etag, last_modified):
+    """Whether a Range request may be honoured given its If-Range validator"""
+    validator = request.headers.get('If-Range')
+    if not validator:
+        return True
+    if validator.startswith(('"', 'W/')):
+        # If-Range requires a strong comparison, so weak tags never match
+        return etag is not None and validator == etag
+    return parse_http_date_safe(validator) == last_modified
+
+
+def range_segments(ranges, size, content_type):
+    """Describe a ranged body as a list of bytes literals and (start, end) file slices"""
+    if len(ranges) == 1:
+        return ranges, None
+
+    boundary = uuid.uuid4().hex
+    segments = []
+    for start, end in ranges:
+        segments.append(
+            f"--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n".encode()
+        )
+        segments.append((start, end))
+        segments.append(b"\r\n")
+    segments.append(f"--{boundary}--\r\n".encode())
+    return segments, boundary
+
+
+def segments_length(segments):
+    return sum(
+        len(segment) if isinstance(segment, bytes) else segment[1] - segment[0] + 1
+        for segment in segments
+    )
+
+
+def iter_segments(field_file, segments):
+    """Yield the bytes of a ranged body, reading file slices in chunks"""
+    with field_file.open('rb') as f:
+        for segment in segments:
+            if isinstance(segment, bytes):
+                yield segment
+                continue
+            start, end = segment
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(STREAM_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+async def aiter_segments(field_file, segments):
+    """Async version of iter_segments for ASGI servers.
+
+    Each blocking open/seek/read runs in a worker thread only for its own
+    duration, so a slow client holds no thread while it drains the socket.
+    """
+    f = await sync_to_async(field_file.storage.open, thread_sensitive=False)(field_file.name, 'rb')
+    try:
+        for segment in segments:
+            if isinstance(segment, bytes):
+                yield segment
+                continue
+            start, end = segment
+            await sync_to_async(f.seek, thread_sensitive=False)(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await sync_to_async(f.read, thread_sensitive=False)(min(STREAM_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+    finally:
+        await sync_to_async(f.close, thread_sensitive=False)()
+
+
+def build_download_response(request, uploaded_file, asynchronous=False):
+    """Return a response delivering the bytes of an UploadedFile.
+
+    Conditional requests (If-None-Match, If-Modified-Since, ...) are answered
+    from the stored hash and upload time without touching the file. In the
+    offload modes Django never opens the file: the front-end server (nginx for
+    X-Accel-Redirect, Apache/lighttpd for X-Sendfile) performs the transfer,
+    including Range handling, after Django has checked permissions. In stream
+    mode Range/If-Range requests are answered with 206 responses, including
+    multipart/byteranges for several ranges. With ``asynchronous`` the body
+    is produced by an async iterator, as ASGI servers need.
+    """
+    etag = get_etag(uploaded_file)
+    last_modified = get_last_modified(uploaded_file)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = build_content_response(request, uploaded_file, etag, last_modified, asynchronous)
+
+    if etag:
+        response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def build_content_response(request, uploaded_file, etag, last_modified, asynchronous=False):
+    mode = settings.SECURE_DOWNLOAD_MODE
+    name = uploaded_file.file.name
+    filename = uploaded_file.display_name
+    content_type = uploaded_file.content_type
+    if not content_type:
+        content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    if mode == DOWNLOAD_MODE_STREAM:
+        return build_stream_response(
+            request, uploaded_file, filename, content_type, etag, last_modified, asynchronous
+        )
+
+    response = HttpResponse(content_type=content_type)
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+
+    if mode == DOWNLOAD_MODE_X_ACCEL:
+        response['X-Accel-Redirect'] = settings.SECURE_DOWNLOAD_ACCEL_PREFIX + quote(name)
+    elif mode == DOWNLOAD_MODE_X_SENDFILE:
+        response['X-Sendfile'] = uploaded_file.file.path
+    else:
+        raise ImproperlyConfigured(f"Unknown SECURE_DOWNLOAD_MODE: {mode!r}")
+
+    return response
+
+
+def build_stream_response(request, uploaded_file, filename, content_type, etag, last_modified, asynchronous=False):
+    size = uploaded_file.size
+    if size is None:
+        # Only rows that predate the metadata backfill need a stat
+        size = uploaded_file.file.size
+    ranges = None
+    if request.method in ('GET', 'HEAD') and if_range_passes(request, etag, last_modified):
+        ranges = parse_range_header(request.headers.get('Range'), size)
+
+    iter_body = aiter_segments if asynchronous else iter_segments
+
+    if ranges is None and not asynchronous:
+        response = FileResponse(
+            uploaded_file.file, as_attachment=True, filename=filename, content_type=content_type
+        )
+    elif ranges is None:
+        segments = [(0, size - 1)] if size else []
+        response = StreamingHttpResponse(iter_body(uploaded_file.file, segments), content_type=content_type)
+        response['Content-Length'] = size
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+    elif not ranges:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{size}"
+    else:
+        segments, boundary = range_segments(ranges, size, content_type)
+        if boundary:
+            response_type = f"multipart/byteranges; boundary={boundary}"
+        else:
+            response_type = content_type
+        response = StreamingHttpResponse(
+            iter_body(uploaded_file.file, segments), status=206, content_type=response_type
+        )
+        response['Content-Length'] = segments_length(segments)
+        if not boundary:
+            start, end = ranges[0]
+            response['Content-Range'] = f"bytes {start}-{end}/{size}"
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1 @@
+# This file makes Python treat the directories as packages
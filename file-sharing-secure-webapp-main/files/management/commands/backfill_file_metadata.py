@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from files.models import UploadedFile
+from files.utils import hash_file
+from files.validators import detect_content_type, get_extension
+
+import os
+
+
+class Command(BaseCommand):
+    help = 'Populate size, MIME type, content hash and original name for uploads recorded without them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Rows written per UPDATE batch (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fields = ['size', 'content_type', 'sha256', 'original_name', 'extension']
+        pending = UploadedFile.objects.filter(
+            Q(size__isnull=True) | Q(content_type='') | Q(sha256='') | Q(original_name='')
+        ).only('id', 'file', *fields).order_by('id')
+
+        updated = missing = 0
+        batch = []
+        for uploaded_file in pending.iterator(chunk_size=batch_size):
+            storage = uploaded_file.file.storage
+            name = uploaded_file.file.name
+            if not storage.exists(name):
+                missing += 1
+                self.stdout.write(self.style.WARNING(f'Missing file for upload {uploaded_file.id}: {name}'))
+                continue
+
+            if not uploaded_file.original_name:
+                uploaded_file.original_name = os.path.basename(name)
+            if not uploaded_file.extension:
+                uploaded_file.extension = get_extension(uploaded_file.original_name)
+            if uploaded_file.size is None:
+                uploaded_file.size = storage.size(name)
+            if not uploaded_file.content_type:
+                uploaded_file.content_type = detect_content_type(uploaded_file.original_name)
+            if not uploaded_file.sha256:
+                with storage.open(name, 'rb') as f:
+                    uploaded_file.sha256 = hash_file(f)
+
+            batch.append(uploaded_file)
+            if len(batch) >= batch_size:
+                UploadedFile.objects.bulk_update(batch, fields)
+                updated += len(batch)
+                batch = []
+
+        if batch:
+            UploadedFile.objects.bulk_update(batch, fields)
+            updated += len(batch)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Backfilled metadata for {updated} uploads ({missing} missing files)')
+        )
@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from files.models import UploadSession
+
+import os
+import time
+import uuid
+
+
+class Command(BaseCommand):
+    help = 'Delete expired resumable upload sessions and their part files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would be deleted without deleting anything',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        # Finalized sessions only keep their row; their part file became the blob
+        expired = UploadSession.objects.expired()
+        sessions = 0
+        for session in expired.filter(uploaded_file__isnull=True).iterator():
+            sessions += 1
+            if not dry_run:
+                part_path = session.part_path
+                session.delete()
+                self.remove(part_path)
+        finalized = expired.filter(uploaded_file__isnull=False)
+        finalized_count = finalized.count() if dry_run else finalized.delete()[0]
+
+        orphans = self.collect_orphans(dry_run)
+
+        verb = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {sessions} expired sessions, {finalized_count} finalized sessions '
+            f'and {orphans} orphaned part files'
+        ))
+
+    def collect_orphans(self, dry_run):
+        """Remove old part files whose session no longer exists"""
+        directory = settings.RESUMABLE_UPLOAD_DIR
+        if not os.path.isdir(directory):
+            return 0
+        cutoff = time.time() - settings.UPLOAD_SESSION_MAX_AGE
+        count = 0
+        for filename in os.listdir(directory):
+            path = os.path.join(directory, filename)
+            session_id, extension = os.path.splitext(filename)
+            if extension != '.part' or os.path.getmtime(path) >= cutoff:
+                continue
+            try:
+                if UploadSession.objects.filter(pk=uuid.UUID(session_id)).exists():
+                    continue
+            except ValueError:
+                pass
+            count += 1
+            if not dry_run:
+                self.remove(path)
+        return count
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
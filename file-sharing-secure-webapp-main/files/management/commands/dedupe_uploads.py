@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from files.models import Blob, UploadedFile
+from files.utils import hash_file
+
+import os
+import shutil
+
+
+class Command(BaseCommand):
+    help = 'Move existing uploads into content-addressed blob storage, storing identical files once'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many files and bytes would be deduplicated',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        storage = UploadedFile._meta.get_field('file').storage
+        seen = set()
+        moved = duplicates = missing = reclaimed = 0
+
+        pending = UploadedFile.objects.filter(blob__isnull=True).order_by('id')
+        for uploaded_file in pending.iterator(chunk_size=500):
+            name = uploaded_file.file.name
+            path = storage.path(name)
+            if not os.path.exists(path):
+                missing += 1
+                self.stdout.write(self.style.WARNING(f'Missing file for upload {uploaded_file.id}: {name}'))
+                continue
+
+            with open(path, 'rb') as f:
+                sha256 = hash_file(f)
+            size = os.path.getsize(path)
+
+            duplicate = sha256 in seen or Blob.objects.filter(pk=sha256).exists()
+            seen.add(sha256)
+            if duplicate:
+                duplicates += 1
+                reclaimed += size
+            else:
+                moved += 1
+            if dry_run:
+                continue
+
+            # Link (or copy) into staging so the original survives until the row is committed
+            staging_path = storage.staging_path()
+            try:
+                os.link(path, staging_path)
+            except OSError:
+                shutil.copyfile(path, staging_path)
+
+            with transaction.atomic():
+                blob = Blob.acquire(sha256, size)
+                uploaded_file.file = storage.ingest(staging_path, sha256)
+                uploaded_file.blob = blob
+                uploaded_file.sha256 = sha256
+                uploaded_file.original_name = uploaded_file.original_name or os.path.basename(name)
+                uploaded_file.save(update_fields=['file', 'blob', 'sha256', 'original_name'])
+            os.remove(path)
+
+        verb = 'Would deduplicate' if dry_run else 'Deduplicated'
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{verb} {moved + duplicates} uploads: {moved} unique, {duplicates} duplicates '
+                f'({reclaimed} bytes reclaimed), {missing} missing'
+            )
+        )
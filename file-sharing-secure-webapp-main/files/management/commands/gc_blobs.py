@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from files.models import Blob, UploadedFile
+from files.storage import BLOB_DIR, STAGING_DIR
+
+import os
+
+
+class Command(BaseCommand):
+    help = 'Delete stored blobs that are no longer referenced by any upload'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-minutes',
+            type=int,
+            default=60,
+            help='Only collect blobs unreferenced for at least this long (default: 60)',
+        )
+        parser.add_argument(
+            '--orphans',
+            action='store_true',
+            help='Also remove blob files without a Blob row and stale staging files',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would be deleted without deleting anything',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        cutoff = timezone.now() - timezone.timedelta(minutes=options['grace_minutes'])
+        storage = UploadedFile._meta.get_field('file').storage
+
+        collected = 0
+        candidates = Blob.objects.filter(ref_count=0, updated_at__lt=cutoff).values_list('pk', flat=True)
+        for sha256 in candidates.iterator():
+            with transaction.atomic():
+                # Re-check under a row lock: an upload may have taken a reference meanwhile
+                blob = Blob.objects.select_for_update().filter(pk=sha256, ref_count=0).first()
+                if blob is None or UploadedFile.objects.filter(blob=blob).exists():
+                    continue
+                collected += 1
+                if dry_run:
+                    continue
+                blob.delete()
+                name = storage.blob_name(sha256)
+                transaction.on_commit(lambda name=name: storage.delete(name))
+
+        orphans = 0
+        if options['orphans']:
+            orphans = self.collect_orphans(storage, cutoff.timestamp(), dry_run)
+
+        verb = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {collected} unreferenced blobs and {orphans} orphaned files'))
+
+    def collect_orphans(self, storage, cutoff, dry_run):
+        count = 0
+        root = storage.path(BLOB_DIR)
+        staging = storage.path(STAGING_DIR)
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+                # Staging files are never referenced; blob files must have a row
+                if directory != staging and Blob.objects.filter(pk=filename).exists():
+                    continue
+                count += 1
+                if not dry_run:
+                    os.remove(path)
+        return count
@@ -0,0 +1,23 @@
+import os
+
+from django.db import migrations
+
+
+def populate_original_name(apps, schema_editor):
+    # Before content-addressed storage the stored name was the uploaded name
+    UploadedFile = apps.get_model("files", "UploadedFile")
+    for uploaded_file in UploadedFile.objects.filter(original_name="").only(
+        "id", "file"
+    ):
+        uploaded_file.original_name = os.path.basename(uploaded_file.file.name)
+        uploaded_file.save(update_fields=["original_name"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("files", "0005_blob_storage"),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_original_name, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:06
+
+import os
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_extension(apps, schema_editor):
+    UploadedFile = apps.get_model("files", "UploadedFile")
+    for uploaded_file in UploadedFile.objects.filter(extension="").only(
+        "id", "original_name"
+    ):
+        extension = os.path.splitext(uploaded_file.original_name)[1].lower().lstrip(".")
+        uploaded_file.extension = extension
+        uploaded_file.save(update_fields=["extension"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0006_populate_original_name"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadedfile",
+            name="extension",
+            field=models.CharField(blank=True, max_length=10),
+        ),
+        migrations.RunPython(populate_extension, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="uploadedfile",
+            index=models.Index(
+                fields=["uploaded_at", "id"], name="files_upload_time_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="uploadedfile",
+            index=models.Index(
+                fields=["uploader", "uploaded_at", "id"], name="files_uploader_time_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="uploadedfile",
+            index=models.Index(
+                fields=["extension", "uploaded_at", "id"],
+                name="files_extension_time_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="uploadedfile",
+            index=models.Index(
+                fields=["original_name"],
+                name="files_name_prefix_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0008_file_metadata"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DownloadLinkRevocation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("revoked_at", models.DateTimeField(db_index=True)),
+                (
+                    "file",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="link_revocation",
+                        to="files.uploadedfile",
+                    ),
+                ),
+            ],
+        ),
+    ]
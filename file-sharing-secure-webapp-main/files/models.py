@@ -1,12 +1,148 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
 from users.models import CustomUser
+from .storage import blob_storage
+from .validators import detect_content_type, get_extension
+import os
 import uuid
 
+class Blob(models.Model):
+    """A stored file body, shared by every UploadedFile with the same content"""
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Last time ref_count changed; garbage collection waits for a grace period after it
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def acquire(cls, sha256, size):
+        """Take a reference on the blob for sha256, creating its row if needed.
+
+        The row stays locked until the caller's transaction ends, so gc_blobs,
+        which re-checks ref_count under the same lock, cannot delete it between
+        the lookup and the increment.
+        """
+        with transaction.atomic():
+            blob, created = cls.objects.select_for_update().get_or_create(
+                sha256=sha256, defaults={'size': size, 'ref_count': 1}
+            )
+            if not created:
+                now = timezone.now()
+                cls.objects.filter(pk=sha256).update(ref_count=F('ref_count') + 1, updated_at=now)
+                blob.ref_count += 1
+                blob.updated_at = now
+        return blob
+
+    @classmethod
+    def release(cls, sha256):
+        cls.objects.filter(pk=sha256, ref_count__gt=0).update(
+            ref_count=F('ref_count') - 1, updated_at=timezone.now()
+        )
+
+    def __str__(self):
+        return f"{self.sha256} ({self.ref_count} references)"
+
+class UploadedFileManager(models.Manager):
+    def create_from_upload(self, uploader, upload, **kwargs):
+        """Record a staged upload, moving its bytes into blob storage.
+
+        ``upload`` must provide ``name``, ``size``, ``sha256`` and
+        ``temporary_file_path()``. Content that is already stored is not
+        written again; the new row just takes another reference on the blob.
+        """
+        storage = self.model._meta.get_field('file').storage
+        with transaction.atomic():
+            blob = Blob.acquire(upload.sha256, upload.size)
+            name = storage.ingest(upload.temporary_file_path(), upload.sha256)
+            return self.create(
+                uploader=uploader,
+                file=name,
+                blob=blob,
+                sha256=upload.sha256,
+                original_name=upload.name,
+                extension=get_extension(upload.name),
+                size=upload.size,
+                content_type=detect_content_type(upload.name),
+                **kwargs
+            )
+
 class UploadedFile(models.Model):
     uploader = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
-    file = models.FileField(upload_to='uploads/')
+    file = models.FileField(upload_to='uploads/', storage=blob_storage)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     secure_token = models.CharField(max_length=100, unique=True, default=uuid.uuid4)
+    # Hex SHA-256 of the content, recorded at upload time; used as the download ETag
+    sha256 = models.CharField(max_length=64, blank=True)
+    # Content-addressed body; null for files that have not been deduplicated yet
+    blob = models.ForeignKey(Blob, null=True, blank=True, on_delete=models.PROTECT, related_name='uploads')
+    original_name = models.CharField(max_length=255, blank=True)
+    # Lower-cased extension without the dot, kept as a column so list filters can use an index
+    extension = models.CharField(max_length=10, blank=True)
+    # Recorded at upload time so listings and download headers never stat the file
+    size = models.PositiveBigIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=255, blank=True)
+
+    objects = UploadedFileManager()
+
+    class Meta:
+        # Every list query orders by (uploaded_at, id) for keyset pagination,
+        # so each filter gets a composite index ending in those columns
+        indexes = [
+            models.Index(fields=['uploaded_at', 'id'], name='files_upload_time_idx'),
+            models.Index(fields=['uploader', 'uploaded_at', 'id'], name='files_uploader_time_idx'),
+            models.Index(fields=['extension', 'uploaded_at', 'id'], name='files_extension_time_idx'),
+            models.Index(fields=['original_name'], name='files_name_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ]
+
+    @property
+    def display_name(self):
+        return self.original_name or os.path.basename(self.file.name)
+
+    def __str__(self):
+        return self.display_name
+
+class DownloadLinkRevocation(models.Model):
+    """Signed download links for the file issued up to revoked_at are no longer valid"""
+    file = models.OneToOneField(UploadedFile, on_delete=models.CASCADE, related_name='link_revocation')
+    revoked_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Links for {self.file_id} revoked at {self.revoked_at}"
+
+class UploadSessionQuerySet(models.QuerySet):
+    def expired(self):
+        """Sessions that have not received a chunk within UPLOAD_SESSION_MAX_AGE"""
+        cutoff = timezone.now() - timezone.timedelta(seconds=settings.UPLOAD_SESSION_MAX_AGE)
+        return self.filter(updated_at__lt=cutoff)
+
+    def active(self):
+        cutoff = timezone.now() - timezone.timedelta(seconds=settings.UPLOAD_SESSION_MAX_AGE)
+        return self.filter(updated_at__gte=cutoff)
+
+class UploadSession(models.Model):
+    """A resumable upload: chunks are appended to a part file until finalized"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    uploader = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    uploaded_file = models.OneToOneField(UploadedFile, null=True, blank=True, on_delete=models.SET_NULL)
+
+    objects = UploadSessionQuerySet.as_manager()
+
+    @property
+    def part_path(self):
+        return os.path.join(settings.RESUMABLE_UPLOAD_DIR, f"{self.id}.part")
+
+    @property
+    def is_complete(self):
+        return self.offset == self.size
 
     def __str__(self):
-        return self.file.name
+        return f"Upload session for {self.filename} ({self.offset}/{self.size})"
@@ -0,0 +1,86 @@
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+import base64
+
+
+class UploadedFileCursorPagination(BasePagination):
+    """Keyset pagination over (uploaded_at, id).
+
+    Each page is a single index range scan starting after the last row of the
+    previous page, so the cost of a page does not grow with the table or with
+    how deep the client has paged. The cursor is opaque to clients.
+    """
+    page_size = 50
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        rows = list(self.page_queryset(queryset, request))
+        return self.set_page(rows)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        rows = [row async for row in self.page_queryset(queryset, request)]
+        return self.set_page(rows)
+
+    def page_queryset(self, queryset, request):
+        """Return the query for the requested page, with one extra row to detect a next page"""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by('uploaded_at', 'id')
+        position = self.decode_cursor(request)
+        if position is not None:
+            uploaded_at, pk = position
+            # The leading range condition lets the database seek on the (uploaded_at, id) index
+            queryset = queryset.filter(uploaded_at__gte=uploaded_at).filter(
+                Q(uploaded_at__gt=uploaded_at) | Q(id__gt=pk)
+            )
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value = base64.urlsafe_b64decode(encoded.encode()).decode()
+            uploaded_at, pk = value.rsplit('|', 1)
+            position = parse_datetime(uploaded_at), int(pk)
+        except (ValueError, UnicodeDecodeError):
+            raise ValidationError({self.cursor_query_param: "Invalid cursor"})
+        if position[0] is None:
+            raise ValidationError({self.cursor_query_param: "Invalid cursor"})
+        return position
+
+    def encode_cursor(self, uploaded_file):
+        value = f"{uploaded_file.uploaded_at.isoformat()}|{uploaded_file.pk}"
+        return base64.urlsafe_b64encode(value.encode()).decode()
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
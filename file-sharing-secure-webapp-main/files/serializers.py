@@ -1,7 +1,48 @@
 from rest_framework import serializers
-from .models import UploadedFile
+import os
+from .models import UploadedFile, UploadSession
+from .validators import ALLOWED_EXTENSIONS
 
 class UploadedFileSerializer(serializers.ModelSerializer):
+    # No storage path or URL: file bodies are only served through signed download links
     class Meta:
         model = UploadedFile
-        fields = ['id', 'file', 'uploaded_at']
+        fields = ['id', 'original_name', 'size', 'content_type', 'sha256', 'uploaded_at']
+
+class FileListFilterSerializer(serializers.Serializer):
+    """Query parameters accepted by FileListView"""
+    uploader = serializers.IntegerField(required=False)
+    uploaded_after = serializers.DateTimeField(required=False)
+    uploaded_before = serializers.DateTimeField(required=False)
+    extension = serializers.ChoiceField(
+        choices=[extension.lstrip('.') for extension in ALLOWED_EXTENSIONS], required=False
+    )
+    name_prefix = serializers.CharField(required=False, max_length=255)
+
+    def filter_queryset(self, queryset):
+        filters = self.validated_data
+        if 'uploader' in filters:
+            queryset = queryset.filter(uploader_id=filters['uploader'])
+        if 'uploaded_after' in filters:
+            queryset = queryset.filter(uploaded_at__gte=filters['uploaded_after'])
+        if 'uploaded_before' in filters:
+            queryset = queryset.filter(uploaded_at__lt=filters['uploaded_before'])
+        if 'extension' in filters:
+            queryset = queryset.filter(extension=filters['extension'])
+        if 'name_prefix' in filters:
+            # Case-sensitive so the prefix index on original_name can be used
+            queryset = queryset.filter(original_name__startswith=filters['name_prefix'])
+        return queryset
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'content_type', 'size', 'offset', 'created_at']
+        read_only_fields = ['id', 'offset', 'created_at']
+
+    def validate_filename(self, value):
+        # Only keep the base name, like Django does for multipart uploads
+        name = os.path.basename(value.replace('\\', '/'))
+        if not name:
+            raise serializers.ValidationError("Invalid filename")
+        return name
@@ -0,0 +1,22 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Blob, DownloadLinkRevocation, UploadedFile
+from .signing import forget_download_file, revocations
+
+
+@receiver(post_delete, sender=UploadedFile)
+def release_blob(sender, instance, **kwargs):
+    """Drop the deleted row's reference so the blob can be garbage collected"""
+    if instance.blob_id:
+        Blob.release(instance.blob_id)
+
+
+@receiver(post_save, sender=UploadedFile)
+@receiver(post_delete, sender=UploadedFile)
+def forget_cached_metadata(sender, instance, **kwargs):
+    forget_download_file(instance.pk)
+
+
+@receiver(post_save, sender=DownloadLinkRevocation)
+def reload_revocations(sender, instance, **kwargs):
+    revocations.invalidate()
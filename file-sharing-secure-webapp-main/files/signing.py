@@ -0,0 +1,163 @@
+"""Signed, expiring download links.
+
+A link token is ``<key id>.<payload>.<signature>`` where the payload is
+``[file_id, issued_at, expires_at]`` signed with the key named by the key id
+(see ``DOWNLOAD_LINK_KEYS``). Verifying a token needs no database access:
+revocations are held in a small per-process table that is reloaded every
+``DOWNLOAD_LINK_REVOCATION_REFRESH`` seconds, and the file's metadata is read
+from the cache when one is shared between processes.
+
+Tokens without a key id, the old never-expiring ``secure_token`` values, are
+no longer accepted.
+"""
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+from itsdangerous import BadSignature, URLSafeSerializer
+from users.authentication import get_shared_cache
+from .models import DownloadLinkRevocation, UploadedFile
+
+import datetime
+import threading
+import time
+
+LINK_SALT = 'file-download'
+
+# UploadedFile fields needed to serve a download, cached per file
+DOWNLOAD_FIELDS = ('id', 'file', 'sha256', 'original_name', 'size', 'content_type', 'uploaded_at')
+METADATA_CACHE_TIMEOUT = 60 * 60
+
+
+def get_signer(key_id):
+    secret = settings.DOWNLOAD_LINK_KEYS.get(key_id)
+    if secret is None:
+        return None
+    return URLSafeSerializer(secret, salt=LINK_SALT)
+
+
+def sign_download_token(file_id, max_age=None):
+    """Return a signed token for file_id and the Unix time it expires at.
+
+    max_age is capped at DOWNLOAD_LINK_MAX_AGE, the window revocations are kept for.
+    """
+    key_id = settings.DOWNLOAD_LINK_KEY_ID
+    issued_at = int(time.time())
+    expires_at = issued_at + min(max_age or settings.DOWNLOAD_LINK_MAX_AGE, settings.DOWNLOAD_LINK_MAX_AGE)
+    payload = get_signer(key_id).dumps([file_id, issued_at, expires_at])
+    return f"{key_id}.{payload}", expires_at
+
+
+def build_download_link(request, file_id):
+    """Absolute signed download URL for file_id, and its expiry time"""
+    token, expires_at = sign_download_token(file_id)
+    link = request.build_absolute_uri(reverse('secure_download', kwargs={'token': token}))
+    return link, expires_at
+
+
+def verify_download_token(token):
+    """Return the file ID a signed token grants access to, or None.
+
+    None is returned for a bad signature, an unknown key id, an expired token
+    or a token issued before its file's links were revoked.
+    """
+    key_id, _, payload = token.partition('.')
+    signer = get_signer(key_id)
+    if signer is None:
+        return None
+
+    try:
+        file_id, issued_at, expires_at = signer.loads(payload)
+    except (BadSignature, TypeError, ValueError):
+        return None
+
+    if expires_at <= time.time():
+        return None
+    if revocations.is_revoked(file_id, issued_at):
+        return None
+    return file_id
+
+
+class RevocationList:
+    """Per-process copy of the recent DownloadLinkRevocation rows.
+
+    Only revocations younger than DOWNLOAD_LINK_MAX_AGE are loaded: every
+    token issued before an older revocation has expired anyway, so the table
+    stays small however many links have ever been revoked.
+    """
+
+    def __init__(self):
+        self.revoked = {}
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        cutoff = timezone.now() - datetime.timedelta(seconds=settings.DOWNLOAD_LINK_MAX_AGE)
+        rows = DownloadLinkRevocation.objects.filter(revoked_at__gte=cutoff).values_list('file_id', 'revoked_at')
+        self.revoked = {file_id: revoked_at.timestamp() for file_id, revoked_at in rows}
+        self.loaded_at = time.monotonic()
+
+    def invalidate(self):
+        self.loaded_at = None
+
+    def is_revoked(self, file_id, issued_at):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > settings.DOWNLOAD_LINK_REVOCATION_REFRESH:
+            with self.lock:
+                # Another thread may have refreshed while this one waited
+                if self.loaded_at is None or time.monotonic() - self.loaded_at > settings.DOWNLOAD_LINK_REVOCATION_REFRESH:
+                    self.refresh()
+
+        revoked_at = self.revoked.get(file_id)
+        return revoked_at is not None and issued_at <= revoked_at
+
+
+revocations = RevocationList()
+
+
+def revoke_download_links(uploaded_file):
+    """Invalidate every signed link issued for the file so far"""
+    # The post_save signal reloads this process's list; others pick it up on their next refresh
+    DownloadLinkRevocation.objects.update_or_create(file=uploaded_file, defaults={'revoked_at': timezone.now()})
+
+
+def metadata_cache_key(file_id):
+    return f"files:download:{file_id}"
+
+
+def get_download_file(file_id):
+    """Return an UploadedFile carrying the fields needed to serve a download.
+
+    The instance is built from cached metadata when possible and is only
+    meant for reading. Metadata is only cached in a cache shared by every
+    process: deleting a file clears it there, whereas a per-process cache
+    would keep serving the file from other workers. Raises
+    UploadedFile.DoesNotExist for unknown IDs.
+    """
+    cache = get_shared_cache()
+    fields = cache.get(metadata_cache_key(file_id)) if cache is not None else None
+    if fields is None:
+        uploaded_file = UploadedFile.objects.only(*DOWNLOAD_FIELDS).get(id=file_id)
+        if cache is not None:
+            fields = {name: getattr(uploaded_file, name) for name in DOWNLOAD_FIELDS}
+            fields['file'] = uploaded_file.file.name
+            cache.set(metadata_cache_key(file_id), fields, METADATA_CACHE_TIMEOUT)
+        return uploaded_file
+
+    return UploadedFile(**fields)
+
+
+def forget_download_file(file_id):
+    cache = get_shared_cache()
+    if cache is not None:
+        cache.delete(metadata_cache_key(file_id))
+
+
+def resolve_download_token(token):
+    """Return the UploadedFile a download token refers to.
+
+    Raises UploadedFile.DoesNotExist if the token is invalid, expired or
+    revoked, or if the file no longer exists.
+    """
+    file_id = verify_download_token(token)
+    if file_id is None:
+        raise UploadedFile.DoesNotExist("Invalid, expired or revoked download link")
+    return get_download_file(file_id)
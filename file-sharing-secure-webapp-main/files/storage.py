@@ -0,0 +1,76 @@
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+
+import hashlib
+import os
+import uuid
+
+BLOB_DIR = 'blobs'
+STAGING_DIR = 'blobs/tmp'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage that names every file after the SHA-256 of its content.
+
+    Identical content is stored once, under ``blobs/ab/cd/<sha256>``. Files are
+    first written to a staging directory inside the same tree so they can be
+    moved into place with an atomic rename. Reference counting lives in the
+    ``Blob`` model; this class only deals with bytes on disk.
+    """
+
+    def blob_name(self, sha256):
+        return f"{BLOB_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+    def staging_path(self):
+        """Return a fresh, unused path in the staging directory"""
+        directory = self.path(STAGING_DIR)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, uuid.uuid4().hex)
+
+    def create_staging_file(self):
+        """Open a new, uniquely named staging file and return (path, file)"""
+        path = self.staging_path()
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+        return path, os.fdopen(fd, 'wb')
+
+    def ingest(self, path, sha256):
+        """Move a fully written file into its blob location and return the blob name.
+
+        If the blob already exists the file is a duplicate and is simply removed.
+        """
+        name = self.blob_name(sha256)
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            os.remove(path)
+        else:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            # A rename on the same file system; concurrent ingests of the same
+            # content write identical bytes, so the last rename winning is fine.
+            file_move_safe(path, full_path, allow_overwrite=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(full_path, self.file_permissions_mode)
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # Names are derived from content in _save(), so the requested name never collides
+        return name
+
+    def _save(self, name, content):
+        sha256 = getattr(content, 'sha256', None)
+        if sha256 and hasattr(content, 'temporary_file_path'):
+            return self.ingest(content.temporary_file_path(), sha256)
+
+        path, staged = self.create_staging_file()
+        digest = hashlib.sha256()
+        try:
+            with staged:
+                for chunk in content.chunks():
+                    staged.write(chunk)
+                    digest.update(chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+        return self.ingest(path, digest.hexdigest())
+
+
+blob_storage = ContentAddressedStorage()
@@ -0,0 +1,51 @@
+"""Generated file contents for benchmarks and test data"""
+from .validators import OOXML_PART_PREFIXES
+
+import io
+import random
+import zipfile
+
+# Main document part of each package type and its content type
+MAIN_PARTS = {
+    'xlsx': ('workbook.xml', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml'),
+    'docx': ('document.xml', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml'),
+    'pptx': ('presentation.xml', 'application/vnd.openxmlformats-officedocument.presentationml.presentation.main+xml'),
+}
+
+# Bytes taken by the package around the padding, roughly
+PACKAGE_OVERHEAD = 600
+
+
+def parse_size(value):
+    """Parse a size such as 512, 16k or 2m into bytes"""
+    value = value.strip().lower()
+    multiplier = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}.get(value[-1:], 1)
+    if multiplier > 1:
+        value = value[:-1]
+    return int(float(value) * multiplier)
+
+
+def ooxml_document(size, seed, extension='xlsx'):
+    """Return a minimal OOXML package of about size bytes whose content depends only on seed.
+
+    The package passes validate_ooxml_archive(); it is padded with random
+    bytes, so different seeds give different blobs.
+    """
+    part, content_type = MAIN_PARTS[extension]
+    part = OOXML_PART_PREFIXES[f'.{extension}'] + part
+    padding = random.Random(seed).randbytes(max(size - PACKAGE_OVERHEAD, 0))
+
+    buffer = io.BytesIO()
+    # Stored, not deflated: random padding does not compress and sizes stay predictable
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        archive.writestr(
+            '[Content_Types].xml',
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            f'<Override PartName="/{part}" ContentType="{content_type}"/>'
+            '</Types>'
+        )
+        archive.writestr(part, '<?xml version="1.0" encoding="UTF-8" standalone="yes"?><root/>')
+        archive.writestr(OOXML_PART_PREFIXES[f'.{extension}'] + 'media/padding.bin', padding)
+    return buffer.getvalue()
@@ -1,3 +1,358 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files import locks
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from users.models import CustomUser
+from .async_views import AsyncFileListView
+from .models import Blob, UploadedFile, UploadSession
+from .signing import get_download_file, metadata_cache_key, resolve_download_token, sign_download_token
+from .storage import STAGING_DIR, blob_storage
+from .synthetic import ooxml_document
+from .upload_handlers import StagedUploadedFile
 
-# Create your tests here.
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+import zlib
+
+DOCX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+
+class FileTestCase(TestCase):
+    """Ops and client users, and a MEDIA_ROOT of their own"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(
+            MEDIA_ROOT=media_root, RESUMABLE_UPLOAD_DIR=os.path.join(media_root, 'upload_sessions'),
+            RATE_LIMIT_ENABLED=False,
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.ops = CustomUser.objects.create_user(
+            username='ops', email='ops@example.com', password='ops-password', is_ops=True
+        )
+        self.client_user = CustomUser.objects.create_user(
+            username='client', email='client@example.com', password='client-password', is_client=True
+        )
+
+    def store_file(self, name='report.docx', content=None):
+        content = ooxml_document(4096, 1, 'docx') if content is None else content
+        path, staged = blob_storage.create_staging_file()
+        with staged:
+            staged.write(content)
+        upload = StagedUploadedFile(
+            path, name, DOCX_CONTENT_TYPE, len(content), None, None, hashlib.sha256(content).hexdigest()
+        )
+        return UploadedFile.objects.create_from_upload(self.ops, upload)
+
+
+class DownloadTokenTests(FileTestCase):
+    def test_signed_token(self):
+        uploaded_file = self.store_file()
+        token, _ = sign_download_token(uploaded_file.id)
+        self.assertEqual(resolve_download_token(token).id, uploaded_file.id)
+
+    def test_legacy_token_rejected(self):
+        uploaded_file = self.store_file()
+        with self.assertRaises(UploadedFile.DoesNotExist):
+            resolve_download_token(str(uploaded_file.secure_token))
+
+    @override_settings(DOWNLOAD_LINK_MAX_AGE=60)
+    def test_max_age_capped(self):
+        _, expires_at = sign_download_token(1, max_age=3600)
+        self.assertLessEqual(expires_at, time.time() + 60)
+
+    def test_metadata_not_cached_per_process(self):
+        # The test cache is a LocMemCache, which other workers would not see invalidated
+        uploaded_file = self.store_file()
+        get_download_file(uploaded_file.id)
+        self.assertIsNone(cache.get(metadata_cache_key(uploaded_file.id)))
+
+
+class FileListTests(FileTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.client_user)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/list/', {'cursor': '!!!!'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'cursor': 'Invalid cursor'})
+
+    async def test_invalid_cursor_async(self):
+        token = await Token.objects.acreate(user=self.client_user)
+        request = AsyncRequestFactory().get(
+            '/api/list/', {'cursor': '!!!!'}, headers={'Authorization': f'Token {token.key}'}
+        )
+        response = await AsyncFileListView.as_view()(request)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content), {'cursor': 'Invalid cursor'})
+
+
+class SecureDownloadTests(FileTestCase):
+    def setUp(self):
+        super().setUp()
+        self.content = ooxml_document(4096, 2, 'docx')
+        self.uploaded_file = self.store_file(content=self.content)
+        token, _ = sign_download_token(self.uploaded_file.id)
+        self.url = f'/api/secure-download/{token}/'
+        self.client.force_login(self.client_user)
+
+    def download(self, headers=None):
+        response = self.client.get(self.url, headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_full(self):
+        response, body = self.download()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['ETag'], f'"{self.uploaded_file.sha256}"')
+
+    def test_single_range(self):
+        response, body = self.download({'Range': 'bytes=10-99'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.content[10:100])
+        self.assertEqual(response['Content-Range'], f'bytes 10-99/{len(self.content)}')
+        self.assertEqual(response['Content-Length'], '90')
+
+    def test_suffix_range(self):
+        response, body = self.download({'Range': 'bytes=-100'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.content[-100:])
+        size = len(self.content)
+        self.assertEqual(response['Content-Range'], f'bytes {size - 100}-{size - 1}/{size}')
+
+    def test_open_ended_range(self):
+        response, body = self.download({'Range': 'bytes=1000-'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.content[1000:])
+
+    def test_unsatisfiable_range(self):
+        response, _ = self.download({'Range': f'bytes={len(self.content)}-'})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_multiple_ranges(self):
+        response, body = self.download({'Range': 'bytes=0-9,100-149'})
+        self.assertEqual(response.status_code, 206)
+        content_type, _, boundary = response['Content-Type'].partition('; boundary=')
+        self.assertEqual(content_type, 'multipart/byteranges')
+        self.assertEqual(int(response['Content-Length']), len(body))
+
+        parts = body.split(f'--{boundary}'.encode())
+        self.assertEqual(parts[0], b'')
+        self.assertEqual(parts[-1], b'--\r\n')
+        size = len(self.content)
+        for part, (start, end) in zip(parts[1:-1], [(0, 9), (100, 149)]):
+            headers, _, data = part.partition(b'\r\n\r\n')
+            self.assertIn(f'Content-Range: bytes {start}-{end}/{size}'.encode(), headers)
+            self.assertEqual(data, self.content[start:end + 1] + b'\r\n')
+
+    def test_if_range_matching(self):
+        response, body = self.download({'Range': 'bytes=0-9', 'If-Range': f'"{self.uploaded_file.sha256}"'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.content[:10])
+
+    def test_if_range_not_matching(self):
+        response, body = self.download({'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+
+    def test_if_none_match(self):
+        response, body = self.download({'If-None-Match': f'"{self.uploaded_file.sha256}"'})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(body, b'')
+
+
+class UploadSessionTests(FileTestCase):
+    def setUp(self):
+        super().setUp()
+        self.content = ooxml_document(4096, 3, 'docx')
+        self.client.force_login(self.ops)
+        response = self.client.post('/api/upload-sessions/', {
+            'filename': 'deck.docx', 'content_type': DOCX_CONTENT_TYPE, 'size': len(self.content),
+        })
+        self.assertEqual(response.status_code, 201)
+        self.session = UploadSession.objects.get()
+        self.url = f'/api/upload-sessions/{self.session.id}/'
+
+    def patch(self, data, offset):
+        return self.client.patch(
+            self.url, data, content_type='application/octet-stream', headers={'Upload-Offset': str(offset)}
+        )
+
+    def finalize(self):
+        return self.client.post(f'{self.url}finalize/')
+
+    def test_chunks_and_finalize(self):
+        self.assertEqual(self.patch(self.content[:1000], 0).status_code, 200)
+        response = self.patch(self.content[1000:], 1000)
+        self.assertEqual(response['Upload-Offset'], str(len(self.content)))
+
+        response = self.finalize()
+        self.assertEqual(response.status_code, 201)
+        uploaded_file = UploadedFile.objects.get()
+        with uploaded_file.file.open('rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertFalse(os.path.exists(self.session.part_path))
+        self.assertEqual(os.listdir(blob_storage.path(STAGING_DIR)), [])
+
+    def test_offset_mismatch(self):
+        self.patch(self.content[:1000], 0)
+        response = self.patch(self.content[500:1500], 500)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], '1000')
+        self.assertEqual(os.path.getsize(self.session.part_path), 1000)
+
+    def test_chunk_past_declared_size(self):
+        response = self.patch(self.content + b'extra', 0)
+        self.assertEqual(response.status_code, 400)
+
+    def test_expired_session(self):
+        self.patch(self.content, 0)
+        UploadSession.objects.update(updated_at=timezone.now() - timezone.timedelta(days=2))
+        with override_settings(UPLOAD_SESSION_MAX_AGE=86400):
+            self.assertEqual(self.client.get(self.url).status_code, 404)
+            self.assertEqual(self.patch(b'', len(self.content)).status_code, 404)
+            self.assertEqual(self.finalize().status_code, 404)
+        self.assertFalse(UploadedFile.objects.exists())
+
+    def test_finalize_incomplete(self):
+        self.patch(self.content[:1000], 0)
+        response = self.finalize()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 1000)
+
+    def test_finalize_twice(self):
+        self.patch(self.content, 0)
+        self.assertEqual(self.finalize().status_code, 201)
+        self.assertEqual(self.finalize().status_code, 404)
+        self.assertEqual(UploadedFile.objects.count(), 1)
+
+    def test_finalize_while_chunk_in_progress(self):
+        self.patch(self.content, 0)
+        with open(self.session.part_path, 'rb') as part:
+            locks.lock(part, locks.LOCK_EX)
+            self.assertEqual(self.finalize().status_code, 409)
+        self.assertEqual(self.finalize().status_code, 201)
+
+
+class StreamingUploadTests(FileTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.ops)
+
+    def upload(self, name, content):
+        return self.client.post('/api/upload/', {'file': SimpleUploadedFile(name, content, DOCX_CONTENT_TYPE)})
+
+    def assertRejected(self, response, error):
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': error})
+        self.assertFalse(UploadedFile.objects.exists())
+        # Rejected files never outlive the request
+        staging = blob_storage.path(STAGING_DIR)
+        self.assertEqual(os.listdir(staging) if os.path.isdir(staging) else [], [])
+
+    def test_upload(self):
+        content = ooxml_document(4096, 4, 'docx')
+        response = self.upload('report.docx', content)
+        self.assertEqual(response.status_code, 200)
+        uploaded_file = UploadedFile.objects.get()
+        self.assertEqual(uploaded_file.sha256, hashlib.sha256(content).hexdigest())
+        self.assertEqual(uploaded_file.size, len(content))
+        self.assertEqual(os.listdir(blob_storage.path(STAGING_DIR)), [])
+
+    @override_settings(UPLOAD_MAX_SIZE=100 * 1024)
+    def test_too_large(self):
+        response = self.upload('report.docx', ooxml_document(300 * 1024, 5, 'docx'))
+        self.assertRejected(response, "File is too large")
+
+    def test_extension(self):
+        self.assertRejected(self.upload('notes.txt', b'plain text'), "Only .pptx, .docx, .xlsx files allowed")
+
+    def test_not_a_zip(self):
+        self.assertRejected(self.upload('report.docx', b'%PDF-1.7 ' * 100), "File is not a valid Office document")
+
+    def test_zip_that_is_not_ooxml(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('readme.txt', 'not an office document')
+        self.assertRejected(self.upload('report.docx', archive.getvalue()), "File is not a valid Office document")
+
+    def test_content_does_not_match_extension(self):
+        response = self.upload('report.docx', ooxml_document(4096, 6, 'xlsx'))
+        self.assertRejected(response, "File content does not match its extension")
+
+
+class BundleDownloadTests(FileTestCase):
+    def setUp(self):
+        super().setUp()
+        self.contents = [ooxml_document(4096, seed, 'docx') for seed in (7, 8, 9)]
+        # Two files with the same name, which the archive must keep apart
+        self.files = [
+            self.store_file('report.docx', self.contents[0]),
+            self.store_file('report.docx', self.contents[1]),
+            self.store_file('summary.docx', self.contents[2]),
+        ]
+        self.url = f"/api/bundle/?ids={','.join(str(f.id) for f in self.files)}"
+
+    def assertBundle(self, body):
+        with zipfile.ZipFile(io.BytesIO(body)) as archive:
+            self.assertEqual(archive.namelist(), ['report.docx', 'report (2).docx', 'summary.docx'])
+            # Reads every member and checks it against its CRC
+            self.assertIsNone(archive.testzip())
+            for info, content in zip(archive.infolist(), self.contents):
+                self.assertEqual(info.compress_type, zipfile.ZIP_STORED)
+                self.assertEqual(info.CRC, zlib.crc32(content))
+                self.assertEqual(archive.read(info), content)
+
+    def test_bundle(self):
+        self.client.force_login(self.client_user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.assertBundle(b''.join(response.streaming_content))
+
+    @override_settings(ASYNC_FILE_VIEWS=True)
+    async def test_bundle_async(self):
+        await self.async_client.aforce_login(self.client_user)
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        self.assertBundle(b''.join([chunk async for chunk in response.streaming_content]))
+
+    def test_missing_file(self):
+        self.client.force_login(self.client_user)
+        response = self.client.get(f'/api/bundle/?ids={self.files[0].id},999999')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['missing'], [999999])
+
+
+class BlobTests(TestCase):
+    def test_acquire(self):
+        blob = Blob.acquire('a' * 64, 10)
+        self.assertEqual(blob.ref_count, 1)
+        blob = Blob.acquire('a' * 64, 10)
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+
+    def test_acquire_after_collection(self):
+        # gc_blobs deleted the unreferenced row; the next upload of the content recreates it
+        Blob.acquire('b' * 64, 10)
+        Blob.release('b' * 64)
+        Blob.objects.filter(ref_count=0).delete()
+        blob = Blob.acquire('b' * 64, 10)
+        self.assertEqual(blob.ref_count, 1)
+        self.assertEqual(Blob.objects.get(pk='b' * 64).ref_count, 1)
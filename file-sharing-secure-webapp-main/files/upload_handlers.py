@@ -0,0 +1,129 @@
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from .storage import blob_storage
+from .validators import ALLOWED_EXTENSIONS, ZIP_SIGNATURE, validate_ooxml_archive
+
+import hashlib
+import os
+
+
+class StagedUploadedFile(UploadedFile):
+    """An upload whose bytes sit in blob storage's staging area, already hashed.
+
+    Pass it to ``UploadedFile.objects.create_from_upload()``, which moves it
+    into place with a rename instead of copying it again.
+    """
+
+    def __init__(self, path, name, content_type, size, charset, content_type_extra, sha256):
+        super().__init__(None, name, content_type, size, charset, content_type_extra)
+        self.path = path
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.path
+
+    def open(self, mode='rb'):
+        self.file = open(self.path, mode)
+        return self
+
+    def close(self):
+        """Close the file and delete it unless it was recorded.
+
+        Django closes uploaded files when the request ends, so, as with
+        TemporaryUploadedFile, staged files the view never recorded (rejected,
+        ignored or left behind by a failed request) do not outlive the request.
+        """
+        try:
+            if self.file is not None:
+                self.file.close()
+        finally:
+            self.delete()
+
+    def delete(self):
+        """Remove the staged file, e.g. when the upload is rejected after parsing"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class StreamingUploadHandler(FileUploadHandler):
+    """Stream uploads once, straight into blob storage.
+
+    Install it per view, before the body is parsed, with
+    ``request.upload_handlers = [StreamingUploadHandler(request)]``.
+
+    While writing, the handler computes the SHA-256 and size of the file and
+    checks the ZIP signature, then verifies the OOXML central directory once
+    the last chunk has arrived. Files are written to the staging area of the
+    storage tree, so recording them is a rename. Rejected files are deleted
+    immediately and the reason is left on ``request.upload_error``.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.path = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.path = None
+        self.sha256 = hashlib.sha256()
+        self.header = b''
+
+        if not self.file_name.endswith(ALLOWED_EXTENSIONS):
+            self.reject("Only .pptx, .docx, .xlsx files allowed")
+        if self.content_length is not None and self.content_length > settings.UPLOAD_MAX_SIZE:
+            self.reject("File is too large")
+
+        self.path, self.file = blob_storage.create_staging_file()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.UPLOAD_MAX_SIZE:
+            self.reject("File is too large")
+
+        if len(self.header) < len(ZIP_SIGNATURE):
+            self.header += raw_data[:len(ZIP_SIGNATURE) - len(self.header)]
+            if not ZIP_SIGNATURE.startswith(self.header):
+                self.reject("File is not a valid Office document")
+
+        self.file.write(raw_data)
+        self.sha256.update(raw_data)
+        # The chunk has been consumed; don't pass it on to other handlers
+        return None
+
+    def file_complete(self, file_size):
+        self.file.close()
+
+        if self.header != ZIP_SIGNATURE:
+            error = "File is not a valid Office document"
+        else:
+            error = validate_ooxml_archive(self.path, self.file_name)
+        if error:
+            self.discard()
+            self.request.upload_error = error
+            return None
+
+        path, self.path = self.path, None
+        return StagedUploadedFile(
+            path=path,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+            sha256=self.sha256.hexdigest(),
+        )
+
+    def upload_interrupted(self):
+        self.discard()
+
+    def reject(self, error):
+        self.discard()
+        self.request.upload_error = error
+        raise SkipFile(error)
+
+    def discard(self):
+        """Delete the partially written file of the current upload, if any"""
+        if self.path is not None:
+            self.file.close()
+            os.remove(self.path)
+            self.path = None
@@ -1,9 +1,28 @@
+from django.conf import settings
 from django.urls import path
-from .views import FileUploadView, FileListView, FileDownloadLinkView, SecureDownloadView
+from .views import (
+    FileUploadView, FileListView, FileDownloadLinkView, SecureDownloadView,
+    UploadSessionCreateView, UploadSessionView, UploadSessionFinalizeView, BundleDownloadView
+)
+from .async_views import AsyncFileListView, AsyncFileDownloadLinkView, AsyncSecureDownloadView
+
+# Under ASGI the read paths use async views so slow downloads don't hold a worker thread
+if settings.ASYNC_FILE_VIEWS:
+    list_view = AsyncFileListView.as_view()
+    download_link_view = AsyncFileDownloadLinkView.as_view()
+    secure_download_view = AsyncSecureDownloadView.as_view()
+else:
+    list_view = FileListView.as_view()
+    download_link_view = FileDownloadLinkView.as_view()
+    secure_download_view = SecureDownloadView.as_view()
 
 urlpatterns = [
     path('upload/', FileUploadView.as_view()),
-    path('list/', FileListView.as_view()),
-    path('download-file/<int:file_id>/', FileDownloadLinkView.as_view()),
-    path('secure-download/<str:token>/', SecureDownloadView.as_view()),
+    path('upload-sessions/', UploadSessionCreateView.as_view()),
+    path('upload-sessions/<uuid:session_id>/', UploadSessionView.as_view()),
+    path('upload-sessions/<uuid:session_id>/finalize/', UploadSessionFinalizeView.as_view()),
+    path('list/', list_view, name='file_list'),
+    path('download-file/<int:file_id>/', download_link_view, name='download_link'),
+    path('secure-download/<str:token>/', secure_download_view, name='secure_download'),
+    path('bundle/', BundleDownloadView.as_view(), name='bundle_download'),
 ]
@@ -0,0 +1,11 @@
+import hashlib
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(file_obj):
+    """Return the hex SHA-256 digest of an open binary file, read in chunks"""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file_obj.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
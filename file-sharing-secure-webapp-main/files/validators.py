@@ -0,0 +1,83 @@
+import os
+import zipfile
+
+ALLOWED_EXTENSIONS = ('.pptx', '.docx', '.xlsx')
+
+VALID_MIME_TYPES = [
+    'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+]
+
+# MIME type of each OOXML package type, keyed by extension
+OOXML_CONTENT_TYPES = {
+    'pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Every OOXML package is a ZIP archive starting with a local file header
+ZIP_SIGNATURE = b'PK\x03\x04'
+
+# Directory holding the main document part of each OOXML package type
+OOXML_PART_PREFIXES = {
+    '.pptx': 'ppt/',
+    '.docx': 'word/',
+    '.xlsx': 'xl/',
+}
+
+
+def get_extension(filename):
+    """Return the lower-cased extension of a filename without the dot, e.g. 'xlsx'"""
+    return os.path.splitext(filename)[1].lower().lstrip('.')
+
+
+def detect_content_type(filename):
+    """MIME type of a validated upload.
+
+    validate_ooxml_archive() has already checked that the package contents
+    match the extension, so the extension identifies the type; the
+    client-supplied Content-Type is never trusted.
+    """
+    return OOXML_CONTENT_TYPES.get(get_extension(filename), 'application/octet-stream')
+
+
+def validate_upload(filename, content_type):
+    """Check the extension and MIME type of an upload.
+
+    Returns an error message, or None if the upload is acceptable.
+    """
+    # Extension Check
+    if not filename.endswith(ALLOWED_EXTENSIONS):
+        return "Only .pptx, .docx, .xlsx files allowed"
+
+    # MIME Type Check (additional security)
+    if content_type not in VALID_MIME_TYPES:
+        return "Invalid file MIME type"
+
+    return None
+
+
+def validate_ooxml_archive(path, filename):
+    """Check that the file at path is an OOXML package matching the filename's extension.
+
+    Only the end-of-central-directory record and the central directory are
+    read, so this costs a seek and a small read regardless of the file size.
+    Returns an error message, or None if the archive is acceptable.
+    """
+    prefix = OOXML_PART_PREFIXES.get(os.path.splitext(filename)[1].lower())
+    if prefix is None:
+        return "Only .pptx, .docx, .xlsx files allowed"
+
+    try:
+        with zipfile.ZipFile(path) as archive:
+            names = archive.namelist()
+    except (zipfile.BadZipFile, OSError):
+        return "File is not a valid Office document"
+
+    if '[Content_Types].xml' not in names:
+        return "File is not a valid Office document"
+    if not any(name.startswith(prefix) for name in names):
+        return "File content does not match its extension"
+
+    return None
@@ -1,96 +1,336 @@
 from django.shortcuts import render, redirect
-from .models import UploadedFile
+from .models import UploadedFile, UploadSession
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseForbidden, FileResponse
+from django.http import HttpResponseForbidden, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+from django.conf import settings
+from django.core.files import locks
+from django.core.files.move import file_move_safe
+from django.db import transaction
+from django.utils import timezone
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser
-from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.authentication import TokenAuthentication, SessionAuthentication
-from .serializers import UploadedFileSerializer
+from rest_framework.authentication import SessionAuthentication
+from .serializers import UploadedFileSerializer, UploadSessionSerializer, FileListFilterSerializer
+from .pagination import UploadedFileCursorPagination
+from .bundles import iter_zip, aiter_zip
+from .downloads import build_download_response
+from .signing import build_download_link, resolve_download_token
+from .storage import blob_storage
+from .upload_handlers import StagedUploadedFile, StreamingUploadHandler
+from .utils import hash_file
+from .validators import validate_upload, validate_ooxml_archive
+from monitoring.query_budget import query_budget
+from users.authentication import CachedTokenAuthentication
 from users.permissions import IsOpsUser, IsClientUser
 
+import os
 import uuid
-import mimetypes
 
+# Bytes read from the request stream per write when appending upload chunks
+UPLOAD_CHUNK_READ_SIZE = 64 * 1024
 
+
+@query_budget(12)
 class FileUploadView(APIView):
     parser_classes = [MultiPartParser]
-    authentication_classes = [SessionAuthentication, TokenAuthentication]
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
     permission_classes = [IsAuthenticated, IsOpsUser]
 
+    def initialize_request(self, request, *args, **kwargs):
+        # Only upload views stream into blob storage; other requests keep Django's handlers
+        request.upload_handlers = [StreamingUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
     def post(self, request):
         file_obj = request.data.get('file')
+        if file_obj is None:
+            # The upload handler leaves the reason on the request when it rejects a file
+            error = getattr(request, 'upload_error', None) or "No file uploaded"
+            return Response({"error": error}, status=400)
 
-        # Extension Check
-        if not file_obj.name.endswith(('.pptx', '.docx', '.xlsx')):
-            return Response({"error": "Only .pptx, .docx, .xlsx files allowed"}, status=400)
-
-        # MIME Type Check (additional security)
-        valid_mime_types = [
-            'application/vnd.openxmlformats-officedocument.presentationml.presentation',
-            'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        ]
-        if file_obj.content_type not in valid_mime_types:
-            return Response({"error": "Invalid file MIME type"}, status=400)
-
-        uploaded_file = UploadedFile.objects.create(
-            uploader=request.user,
-            file=file_obj,
+        error = validate_upload(file_obj.name, file_obj.content_type)
+        if error:
+            file_obj.delete()
+            return Response({"error": error}, status=400)
+
+        # The handler already wrote and hashed the file; recording it is a rename
+        uploaded_file = UploadedFile.objects.create_from_upload(
+            request.user,
+            file_obj,
             secure_token=str(uuid.uuid4())
         )
         return Response(UploadedFileSerializer(uploaded_file).data)
 
 
+@query_budget(3)
+class UploadSessionCreateView(APIView):
+    """Start a resumable upload.
+
+    The client sends the filename, content type and total size, then PATCHes
+    chunks to the session URL and finally POSTs to its finalize URL.
+    """
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated, IsOpsUser]
+
+    def post(self, request):
+        serializer = UploadSessionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+
+        size = serializer.validated_data['size']
+        if size > settings.UPLOAD_MAX_SIZE:
+            return Response({"error": "File is too large"}, status=413)
+
+        session = serializer.save(uploader=request.user)
+        os.makedirs(settings.RESUMABLE_UPLOAD_DIR, exist_ok=True)
+        open(session.part_path, 'wb').close()
+
+        response = Response(UploadSessionSerializer(session).data, status=201)
+        response['Location'] = request.build_absolute_uri(f"/api/upload-sessions/{session.id}/")
+        response['Upload-Offset'] = session.offset
+        return response
+
+
+@query_budget(4, patch=5)
+class UploadSessionView(APIView):
+    """Query the current offset of a resumable upload, or append a chunk to it"""
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated, IsOpsUser]
+
+    def get_session(self, request, session_id):
+        return UploadSession.objects.active().filter(
+            id=session_id, uploader=request.user, uploaded_file__isnull=True
+        ).first()
+
+    def get(self, request, session_id):
+        session = self.get_session(request, session_id)
+        if session is None:
+            return Response({"error": "Upload session not found"}, status=404)
+
+        response = Response(UploadSessionSerializer(session).data)
+        response['Upload-Offset'] = session.offset
+        return response
+
+    def patch(self, request, session_id):
+        try:
+            client_offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            return Response({"error": "Missing or invalid Upload-Offset header"}, status=400)
+
+        session = self.get_session(request, session_id)
+        if session is None:
+            return Response({"error": "Upload session not found"}, status=404)
+
+        try:
+            part = open(session.part_path, 'r+b')
+        except FileNotFoundError:
+            return Response({"error": "Upload session not found"}, status=404)
+
+        with part:
+            # The file lock, not a row lock, keeps concurrent chunks apart, so no
+            # transaction or database connection is held while the body arrives
+            if not locks.lock(part, locks.LOCK_EX | locks.LOCK_NB):
+                return Response({"error": "Another chunk is being written"}, status=409)
+
+            # Re-read the offset now that no other chunk can be in progress
+            session.refresh_from_db(fields=['offset'])
+            if client_offset != session.offset:
+                response = Response({"error": "Offset mismatch", "offset": session.offset}, status=409)
+                response['Upload-Offset'] = session.offset
+                return response
+
+            expected = session.offset
+            written = 0
+            stream = request.stream
+            try:
+                # Drop any bytes left behind by a write that was never recorded
+                part.truncate(expected)
+                part.seek(expected)
+                while stream is not None:
+                    chunk = stream.read(UPLOAD_CHUNK_READ_SIZE)
+                    if not chunk:
+                        break
+                    if expected + written + len(chunk) > session.size:
+                        return Response({"error": "Chunk exceeds declared upload size"}, status=400)
+                    part.write(chunk)
+                    written += len(chunk)
+            finally:
+                part.flush()
+                # Record whatever reached the disk so an interrupted chunk can be resumed
+                recorded = UploadSession.objects.filter(
+                    pk=session.pk, offset=expected, uploaded_file__isnull=True
+                ).update(offset=expected + written, updated_at=timezone.now())
+                session.offset = expected + written
+
+        if not recorded:
+            return Response({"error": "Upload session was finalized or removed"}, status=409)
+        response = Response(UploadSessionSerializer(session).data)
+        response['Upload-Offset'] = session.offset
+        return response
+
+
+@query_budget(15)
+class UploadSessionFinalizeView(APIView):
+    """Validate a fully received upload and turn it into an UploadedFile"""
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated, IsOpsUser]
+
+    def get_session(self, request, session_id):
+        return UploadSession.objects.active().filter(
+            id=session_id, uploader=request.user, uploaded_file__isnull=True
+        ).first()
+
+    def post(self, request, session_id):
+        try:
+            # Named after the session id, so the file can be locked before the row is read
+            part = open(UploadSession(id=session_id).part_path, 'rb')
+        except FileNotFoundError:
+            return Response({"error": "Upload session not found"}, status=404)
+
+        with part:
+            # The lock PATCH takes: no chunk is appended while the part file is
+            # checked and moved, and a concurrent finalize gives up
+            if not locks.lock(part, locks.LOCK_EX | locks.LOCK_NB):
+                return Response({"error": "Upload session is busy"}, status=409)
+
+            # Read under the lock, so a finalize that completed meanwhile is seen
+            session = self.get_session(request, session_id)
+            if session is None:
+                return Response({"error": "Upload session not found"}, status=404)
+            if not session.is_complete:
+                return Response({"error": "Upload is incomplete", "offset": session.offset}, status=409)
+
+            error = (
+                validate_upload(session.filename, session.content_type)
+                or validate_ooxml_archive(session.part_path, session.filename)
+            )
+            if error:
+                os.remove(session.part_path)
+                session.delete()
+                return Response({"error": error}, status=400)
+
+            # Hash and move the file before any transaction: RESUMABLE_UPLOAD_DIR
+            # may be another volume, where the move is a full copy
+            sha256 = hash_file(part)
+            staged_path = blob_storage.staging_path()
+            file_move_safe(session.part_path, staged_path)
+
+            upload = StagedUploadedFile(
+                staged_path, session.filename, session.content_type,
+                session.size, None, None, sha256
+            )
+            # Closing removes the staged file unless create_from_upload moved it into place
+            with upload, transaction.atomic():
+                uploaded_file = UploadedFile.objects.create_from_upload(
+                    request.user,
+                    upload,
+                    secure_token=str(uuid.uuid4())
+                )
+                # The conditional UPDATE is the only row lock taken, and only for the commit
+                finalized = UploadSession.objects.filter(pk=session.pk, uploaded_file__isnull=True).update(
+                    uploaded_file=uploaded_file, updated_at=timezone.now()
+                )
+                if not finalized:
+                    # Removed (e.g. expired and cleaned up) since it was read
+                    transaction.set_rollback(True)
+                    return Response({"error": "Upload session not found"}, status=404)
+
+        return Response(UploadedFileSerializer(uploaded_file).data, status=201)
+
+
+@query_budget(3)
 class FileListView(APIView):
-    authentication_classes = [SessionAuthentication, TokenAuthentication]
+    """List files a page at a time.
+
+    Supports ``uploader``, ``uploaded_after``, ``uploaded_before``,
+    ``extension`` and ``name_prefix`` filters, ``page_size`` (capped) and the
+    opaque ``cursor`` returned as the ``next`` link of the previous page.
+    """
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
     permission_classes = [IsAuthenticated, IsClientUser]
 
     def get(self, request):
-        files = UploadedFile.objects.all()
-        return Response(UploadedFileSerializer(files, many=True).data)
+        filters = FileListFilterSerializer(data=request.query_params)
+        if not filters.is_valid():
+            return Response(filters.errors, status=400)
+
+        paginator = UploadedFileCursorPagination()
+        files = paginator.paginate_queryset(filters.filter_queryset(UploadedFile.objects.all()), request, view=self)
+        return paginator.get_paginated_response(UploadedFileSerializer(files, many=True).data)
 
 
+@query_budget(3)
 class FileDownloadLinkView(APIView):
-    authentication_classes = [SessionAuthentication, TokenAuthentication]
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
     permission_classes = [IsAuthenticated, IsClientUser]
 
     def get(self, request, file_id):
-        try:
-            file = UploadedFile.objects.get(id=file_id)
-            return Response({
-                "download-link": f"http://localhost:8000/api/secure-download/{file.secure_token}/",
-                "message": "success"
-            })
-        except UploadedFile.DoesNotExist:
+        if not UploadedFile.objects.filter(id=file_id).exists():
             return Response({"error": "File not found"}, status=404)
 
+        link, expires_at = build_download_link(request, file_id)
+        return Response({
+            "download-link": link,
+            "expires_at": expires_at,
+            "message": "success"
+        })
 
+
+@query_budget(4)
 class SecureDownloadView(APIView):
-    authentication_classes = [SessionAuthentication, TokenAuthentication]
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
     permission_classes = [IsAuthenticated, IsClientUser]
 
     def get(self, request, token):
         try:
-            file = UploadedFile.objects.get(secure_token=token)
-            return FileResponse(file.file, as_attachment=True, filename=file.file.name)
+            file = resolve_download_token(token)
+            return build_download_response(request, file)
         except UploadedFile.DoesNotExist:
             return Response({"error": "Invalid or expired link"}, status=404)
 
 
+@query_budget(3)
+class BundleDownloadView(APIView):
+    """Stream several files as one ZIP archive: GET /api/bundle/?ids=1,2,3"""
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated, IsClientUser]
+
+    def get(self, request):
+        try:
+            ids = list(dict.fromkeys(int(value) for value in request.query_params.get('ids', '').split(',') if value))
+        except ValueError:
+            return Response({"error": "ids must be a comma-separated list of file IDs"}, status=400)
+        if not ids:
+            return Response({"error": "No files requested"}, status=400)
+        if len(ids) > settings.BUNDLE_MAX_FILES:
+            return Response({"error": f"At most {settings.BUNDLE_MAX_FILES} files per bundle"}, status=400)
+
+        files = UploadedFile.objects.in_bulk(ids)
+        missing = [file_id for file_id in ids if file_id not in files]
+        if missing:
+            return Response({"error": "File not found", "missing": missing}, status=404)
+
+        members = [files[file_id] for file_id in ids]
+        # Under ASGI a sync iterator would be buffered whole; hand it an async one instead
+        body = aiter_zip(members) if settings.ASYNC_FILE_VIEWS else iter_zip(members)
+        response = StreamingHttpResponse(body, content_type='application/zip')
+        response['Content-Disposition'] = content_disposition_header(True, 'files.zip')
+        return response
+
+
+@query_budget(4)
 @login_required
 def generate_secure_link(request, file_id):
     if not request.user.is_client:
         return HttpResponseForbidden()
 
-    try:
-        file = UploadedFile.objects.get(id=file_id)
-    except UploadedFile.DoesNotExist:
+    if not UploadedFile.objects.filter(id=file_id).exists():
         return redirect('dashboard_client')  # Could also render with error
 
-    link = request.build_absolute_uri(f"/api/secure-download/{file.secure_token}/")
+    link, _ = build_download_link(request, file_id)
     files = UploadedFile.objects.all()
     return render(request, 'dashboard_client.html', {'files': files, 'link': link})
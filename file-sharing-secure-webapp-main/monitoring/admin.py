@@ -0,0 +1,119 @@
+from django.contrib import admin
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+from .models import RequestProfile, SlowQuery
+
+import io
+import marshal
+import pstats
+
+
+class LoadedStats:
+    """Stands in for a Profile so pstats.Stats can read stored data"""
+
+    def __init__(self, data):
+        self.stats = marshal.loads(data)
+
+    def create_stats(self):
+        pass
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'method', 'path', 'status_code', 'duration_ms', 'user', 'downloads']
+    list_filter = ['method', 'status_code', 'created_at']
+    search_fields = ['path', 'route', 'user__username']
+    exclude = ['pstats', 'collapsed_stacks']
+    readonly_fields = ['created_at', 'user', 'method', 'path', 'route', 'status_code', 'duration_ms', 'downloads', 'top_functions']
+    ordering = ['-created_at']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def duration_ms(self, obj):
+        return f"{obj.duration * 1000:.1f} ms"
+    duration_ms.short_description = 'Duration'
+
+    def downloads(self, obj):
+        return format_html(
+            '<a href="{}">pstats</a> | <a href="{}">collapsed stacks</a>',
+            reverse('admin:monitoring_requestprofile_pstats', args=[obj.pk]),
+            reverse('admin:monitoring_requestprofile_collapsed', args=[obj.pk]),
+        )
+    downloads.short_description = 'Download'
+
+    def top_functions(self, obj):
+        """The 40 functions with the most cumulative time"""
+        output = io.StringIO()
+        stats = pstats.Stats(LoadedStats(bytes(obj.pstats)), stream=output)
+        stats.sort_stats('cumulative').print_stats(40)
+        return format_html('<pre style="font-size: 11px">{}</pre>', output.getvalue())
+    top_functions.short_description = 'Top functions'
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/pstats/', self.admin_site.admin_view(self.download_pstats),
+                 name='monitoring_requestprofile_pstats'),
+            path('<int:pk>/collapsed/', self.admin_site.admin_view(self.download_collapsed),
+                 name='monitoring_requestprofile_collapsed'),
+        ] + super().get_urls()
+
+    def download(self, request, pk, content, content_type, extension):
+        if not self.has_view_permission(request):
+            return HttpResponse(status=403)
+        response = HttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="request-profile-{pk}.{extension}"'
+        return response
+
+    def download_pstats(self, request, pk):
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        return self.download(request, pk, bytes(profile.pstats), 'application/octet-stream', 'prof')
+
+    def download_collapsed(self, request, pk):
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        return self.download(request, pk, profile.collapsed_stacks, 'text/plain; charset=utf-8', 'folded')
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ['short_sql', 'count', 'mean_ms', 'max_ms', 'view', 'last_seen']
+    list_filter = ['last_seen']
+    search_fields = ['sql', 'view', 'frame']
+    exclude = ['sql', 'plan', 'total_duration', 'max_duration']
+    readonly_fields = [
+        'fingerprint', 'formatted_sql', 'formatted_plan', 'count', 'mean_ms', 'max_ms',
+        'params_shape', 'view', 'frame', 'first_seen', 'last_seen',
+    ]
+    ordering = ['-total_duration']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def short_sql(self, obj):
+        return obj.sql if len(obj.sql) <= 120 else obj.sql[:120] + '…'
+    short_sql.short_description = 'SQL'
+
+    def mean_ms(self, obj):
+        return f"{obj.total_duration / obj.count * 1000:.1f} ms"
+    mean_ms.short_description = 'Mean'
+
+    def max_ms(self, obj):
+        return f"{obj.max_duration * 1000:.1f} ms"
+    max_ms.short_description = 'Max'
+    max_ms.admin_order_field = 'max_duration'
+
+    def formatted_sql(self, obj):
+        return format_html('<pre style="white-space: pre-wrap">{}</pre>', obj.sql)
+    formatted_sql.short_description = 'SQL'
+
+    def formatted_plan(self, obj):
+        return format_html('<pre style="font-size: 11px">{}</pre>', obj.plan or 'No plan')
+    formatted_plan.short_description = 'Plan'
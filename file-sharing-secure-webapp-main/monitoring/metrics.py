@@ -0,0 +1,50 @@
+"""Prometheus metrics shared by the whole project.
+
+With several gunicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty
+directory before the workers start: each process then writes its samples
+there and the /metrics view aggregates all of them (see
+securefiles/gunicorn.conf.py for the hook that cleans up after a worker
+exits). Without it, metrics cover only the process serving the scrape.
+"""
+from prometheus_client import Counter, Histogram
+
+# Request latencies from 5 ms to 30 s
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+# 1 KB to 1 GB in powers of four
+SIZE_BUCKETS = tuple(4 ** n * 1024 for n in range(11))
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds',
+    'Time spent handling a request, up to the response being returned',
+    ['method', 'route', 'status'],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries',
+    'Database queries made while handling a request',
+    ['route'],
+    buckets=QUERY_COUNT_BUCKETS,
+)
+REQUEST_QUERY_DURATION = Histogram(
+    'http_request_db_duration_seconds',
+    'Total time spent in database queries while handling a request',
+    ['route'],
+    buckets=LATENCY_BUCKETS,
+)
+RESPONSE_BYTES = Counter(
+    'http_response_body_bytes',
+    'Response body bytes sent by Django for file downloads',
+    ['route'],
+)
+UPLOAD_SIZE = Histogram(
+    'file_upload_size_bytes',
+    'Size of each stored upload',
+    buckets=SIZE_BUCKETS,
+)
+EMAIL_SEND_DURATION = Histogram(
+    'email_send_duration_seconds',
+    'Time to hand one email to the SMTP server, including retries',
+    ['outcome'],
+    buckets=LATENCY_BUCKETS,
+)
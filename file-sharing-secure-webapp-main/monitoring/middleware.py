@@ -0,0 +1,111 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from contextlib import ExitStack
+from django.db import connections
+from .metrics import REQUEST_DURATION, REQUEST_QUERIES, REQUEST_QUERY_DURATION, RESPONSE_BYTES
+
+import time
+
+
+class QueryRecorder:
+    """Database execute wrapper counting queries and the time they take.
+
+    With keep_sql the SQL of each query is kept in ``queries`` as well.
+    """
+
+    def __init__(self, keep_sql=False):
+        self.count = 0
+        self.duration = 0.0
+        self.queries = [] if keep_sql else None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            if self.queries is not None:
+                self.queries.append(sql)
+
+
+def get_route(request):
+    """URL pattern that matched, e.g. 'api/secure-download/<str:token>/', so labels stay bounded"""
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else 'unmatched'
+
+
+def count_bytes(chunks, route):
+    sent = 0
+    try:
+        for chunk in chunks:
+            sent += len(chunk)
+            yield chunk
+    finally:
+        RESPONSE_BYTES.labels(route).inc(sent)
+
+
+async def acount_bytes(chunks, route):
+    sent = 0
+    try:
+        async for chunk in chunks:
+            sent += len(chunk)
+            yield chunk
+    finally:
+        RESPONSE_BYTES.labels(route).inc(sent)
+
+
+def record_response_bytes(response, route):
+    """Count the body of streamed (download) responses"""
+    if not response.streaming or response.status_code == 304:
+        return
+    if response.has_header('Content-Length'):
+        RESPONSE_BYTES.labels(route).inc(int(response['Content-Length']))
+    elif getattr(response, 'file_to_stream', None) is None:
+        # Replacing streaming_content would stop a FileResponse from using sendfile
+        if response.is_async:
+            response.streaming_content = acount_bytes(response.streaming_content, route)
+        else:
+            response.streaming_content = count_bytes(response.streaming_content, route)
+
+
+class MetricsMiddleware:
+    """Record latency, database queries and download bytes per route.
+
+    Query counts cover queries run on the request's thread, so under ASGI
+    they are only recorded for synchronous views.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        route = get_route(request)
+        REQUEST_QUERIES.labels(route).observe(recorder.count)
+        REQUEST_QUERY_DURATION.labels(route).observe(recorder.duration)
+        self.record(request, response, route, duration)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, get_route(request), time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, route, duration):
+        REQUEST_DURATION.labels(request.method, route, response.status_code).observe(duration)
+        record_response_bytes(response, route)
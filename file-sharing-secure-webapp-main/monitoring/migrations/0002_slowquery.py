@@ -0,0 +1,45 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("monitoring", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SlowQuery",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("fingerprint", models.CharField(max_length=40, unique=True)),
+                ("sql", models.TextField()),
+                ("plan", models.TextField(blank=True)),
+                ("count", models.PositiveIntegerField(default=1)),
+                (
+                    "total_duration",
+                    models.FloatField(help_text="Seconds, over all occurrences"),
+                ),
+                ("max_duration", models.FloatField(help_text="Seconds")),
+                ("params_shape", models.CharField(blank=True, max_length=255)),
+                ("view", models.CharField(blank=True, max_length=255)),
+                ("frame", models.CharField(blank=True, max_length=500)),
+                ("first_seen", models.DateTimeField(auto_now_add=True)),
+                ("last_seen", models.DateTimeField(db_index=True)),
+            ],
+            options={
+                "verbose_name_plural": "slow queries",
+                "ordering": ["-last_seen"],
+            },
+        ),
+    ]
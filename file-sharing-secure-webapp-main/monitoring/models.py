@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.db import models
+
+
+class RequestProfile(models.Model):
+    """A profile of one request, recorded on demand by ProfilingMiddleware"""
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=2000)
+    # URL pattern that matched, e.g. 'api/secure-download/<str:token>/'
+    route = models.CharField(max_length=255, blank=True)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    duration = models.FloatField(help_text='Seconds, including streaming the response body')
+    # cProfile statistics in the format of Profile.dump_stats(), readable with pstats or snakeviz
+    pstats = models.BinaryField()
+    # Sampled stacks, one "frame;frame;frame count" line each, for flamegraph.pl or speedscope
+    collapsed_stacks = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration * 1000:.0f} ms)"
+
+
+class SlowQuery(models.Model):
+    """Slow queries with one fingerprint, recorded by SlowQueryMiddleware"""
+    fingerprint = models.CharField(max_length=40, unique=True)
+    # SQL of the first occurrence, with placeholders for the parameters
+    sql = models.TextField()
+    plan = models.TextField(blank=True)
+    count = models.PositiveIntegerField(default=1)
+    total_duration = models.FloatField(help_text='Seconds, over all occurrences')
+    max_duration = models.FloatField(help_text='Seconds')
+    # Of the latest occurrence
+    params_shape = models.CharField(max_length=255, blank=True)
+    view = models.CharField(max_length=255, blank=True)
+    frame = models.CharField(max_length=500, blank=True)
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ['-last_seen']
+        verbose_name_plural = 'slow queries'
+
+    def __str__(self):
+        return f"{self.sql[:80]} ({self.count}x, max {self.max_duration * 1000:.0f} ms)"
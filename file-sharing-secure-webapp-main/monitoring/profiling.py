@@ -0,0 +1,207 @@
+"""On-demand profiling of single requests.
+
+A staff user (by session or API token) profiles a request by sending an
+``X-Profile`` header or a ``_profile`` query parameter. The request then runs
+under cProfile while a background thread samples its stack every
+PROFILING_SAMPLE_INTERVAL seconds, and the result is stored as a
+RequestProfile: pstats data for snakeviz or ``python -m pstats``, and
+collapsed stacks for flamegraph.pl or speedscope. Both can be downloaded
+from the admin.
+
+For streamed responses, such as downloads, profiling continues until the
+body has been sent. Other responses carry the profile's ID in an
+X-Profile-Id header.
+
+Requests without the header or parameter only pay for a header lookup and a
+substring check of the query string. Requests to async views under ASGI are
+never profiled.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from collections import Counter
+from django.conf import settings
+from users.authentication import get_token_user
+from .middleware import get_route
+from .models import RequestProfile
+
+import cProfile
+import logging
+import marshal
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = '_profile'
+
+
+def profiling_requested(request):
+    return PROFILE_HEADER in request.META or (
+        PROFILE_PARAM in request.META.get('QUERY_STRING', '') and PROFILE_PARAM in request.GET
+    )
+
+
+def get_staff_user(request):
+    """The staff user making the request, by session or API token, or None"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user if user.is_staff else None
+
+    # Token authentication happens inside DRF views, after middleware has run
+    auth = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(auth) == 2 and auth[0].lower() == 'token':
+        user = get_token_user(auth[1])
+        if user is not None and user.is_staff:
+            return user
+    return None
+
+
+def frame_name(code):
+    filename = code.co_filename
+    if filename.startswith(str(settings.BASE_DIR)):
+        filename = os.path.relpath(filename, settings.BASE_DIR)
+    else:
+        _, _, site = filename.rpartition('site-packages' + os.sep)
+        filename = site or filename
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({filename}:{code.co_firstlineno})"
+
+
+class StackSampler(threading.Thread):
+    """Counts the stacks a thread is in, below the frame set as root"""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='request-profiler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.root = None
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            root = self.root
+            frame = sys._current_frames().get(self.thread_id)
+            if root is None or frame is None:
+                continue
+            names = []
+            while frame is not None and frame is not root:
+                names.append(frame_name(frame.f_code))
+                frame = frame.f_back
+            # Samples taken between profiled calls never reach the root
+            if frame is root and names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class RequestProfiler:
+    def __init__(self, interval):
+        self.profile = cProfile.Profile()
+        self.sampler = StackSampler(threading.get_ident(), interval)
+        self.duration = 0.0
+        self.sampler.start()
+
+    def call(self, function, *args):
+        """Return function(*args), run under both profilers"""
+        self.sampler.root = sys._getframe()
+        start = time.perf_counter()
+        self.profile.enable()
+        try:
+            return function(*args)
+        finally:
+            self.profile.disable()
+            self.duration += time.perf_counter() - start
+            self.sampler.root = None
+
+    def stream(self, chunks, on_close):
+        """Iterate chunks under the profilers, calling on_close once done or abandoned"""
+        iterator = iter(chunks)
+        try:
+            while True:
+                try:
+                    chunk = self.call(next, iterator)
+                except StopIteration:
+                    return
+                yield chunk
+        finally:
+            on_close()
+
+    def stop(self):
+        """Stop sampling; return (pstats data, collapsed stacks)"""
+        self.sampler.stop()
+        self.profile.create_stats()
+        # The same bytes Profile.dump_stats() would write
+        return marshal.dumps(self.profile.stats), self.sampler.collapsed()
+
+
+def prune_profiles(keep):
+    """Delete all but the newest keep profiles"""
+    oldest_kept = list(RequestProfile.objects.values_list('created_at', flat=True)[keep - 1:keep])
+    if oldest_kept:
+        RequestProfile.objects.filter(created_at__lt=oldest_kept[0]).delete()
+
+
+class ProfilingMiddleware:
+    """Profile requests from staff users who ask for it (see module docstring).
+
+    Must come after AuthenticationMiddleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self) or not profiling_requested(request) or not settings.PROFILING_ENABLED:
+            return self.get_response(request)
+        user = get_staff_user(request)
+        if user is None:
+            return self.get_response(request)
+
+        # A profiled request's queries include saving the profile
+        request.skip_query_budget = True
+        profiler = RequestProfiler(settings.PROFILING_SAMPLE_INTERVAL)
+        try:
+            response = profiler.call(self.get_response, request)
+        except BaseException:
+            profiler.stop()
+            raise
+
+        def save():
+            pstats, collapsed = profiler.stop()
+            try:
+                profile = RequestProfile.objects.create(
+                    user_id=user.pk,
+                    method=request.method,
+                    path=request.get_full_path()[:2000],
+                    route=get_route(request)[:255],
+                    status_code=response.status_code,
+                    duration=profiler.duration,
+                    pstats=pstats,
+                    collapsed_stacks=collapsed,
+                )
+                prune_profiles(settings.PROFILING_KEEP)
+            except Exception:
+                logger.exception("Could not save the profile of %s %s", request.method, request.path)
+                return None
+            return profile
+
+        if response.streaming and not response.is_async:
+            # Assigning streaming_content also stops a FileResponse from using sendfile,
+            # so that the profile includes sending the body
+            response.streaming_content = profiler.stream(response.streaming_content, save)
+        else:
+            profile = save()
+            if profile is not None:
+                response['X-Profile-Id'] = str(profile.pk)
+        return response
@@ -0,0 +1,100 @@
+"""Per-view limits on the number of database queries.
+
+Declare a view's budget with the query_budget decorator, on a function view
+or on a class-based view's class, optionally with separate budgets for some
+HTTP methods:
+
+    @query_budget(3, post=12)
+    @login_required
+    def dashboard_ops(request): ...
+
+Budgets are constants on purpose: a page whose query count grows with the
+rows it shows (an N+1) soon exceeds any of them.
+
+QueryBudgetMiddleware counts the queries each request runs, including those
+made while rendering templates from lazy querysets, and acts on requests over
+their view's budget according to settings.QUERY_BUDGET_ACTION: 'log' writes a
+warning with the queries, 'raise' raises QueryBudgetExceeded and 'off' skips
+counting altogether. monitoring.testing asserts the budgets in tests.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from .middleware import QueryRecorder
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(max_queries, **per_method):
+    """Declare the most queries a request to the decorated view may run.
+
+    Keyword arguments override the budget for HTTP methods, e.g. post=10.
+    """
+    budgets = {'*': max_queries, **{method.upper(): limit for method, limit in per_method.items()}}
+
+    def decorator(view):
+        # functools.wraps() copies the attribute, so the order of decorators does not matter
+        view.query_budget = budgets
+        return view
+    return decorator
+
+
+def get_query_budget(view, method='GET'):
+    """Budget a resolved view callable declares for an HTTP method, or None"""
+    budgets = getattr(view, 'query_budget', None)
+    if budgets is None:
+        # as_view() functions carry their class
+        budgets = getattr(getattr(view, 'view_class', None), 'query_budget', None)
+    if budgets is None:
+        return None
+    return budgets.get(method.upper(), budgets['*'])
+
+
+def describe_overrun(request, budget, queries):
+    lines = [f"{request.method} {request.path} ran {len(queries)} queries, over its budget of {budget}:"]
+    lines.extend(f"  {sql}" for sql in queries)
+    return "\n".join(lines)
+
+
+class QueryBudgetMiddleware:
+    """Log or raise when a request runs more queries than its view's budget.
+
+    Like MetricsMiddleware it only sees queries run on the request's thread,
+    so under ASGI requests pass through unchecked.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.get_response(request)
+        action = settings.QUERY_BUDGET_ACTION
+        if action == 'off':
+            return self.get_response(request)
+
+        recorder = QueryRecorder(keep_sql=True)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        budget = get_query_budget(match.func, request.method) if match is not None else None
+        if budget is not None and recorder.count > budget and not getattr(request, 'skip_query_budget', False):
+            message = describe_overrun(request, budget, recorder.queries)
+            if action == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
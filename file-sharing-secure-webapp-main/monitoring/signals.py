@@ -0,0 +1,10 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from files.models import UploadedFile
+from .metrics import UPLOAD_SIZE
+
+
+@receiver(post_save, sender=UploadedFile)
+def observe_upload(sender, instance, created, **kwargs):
+    if created and instance.size is not None:
+        UPLOAD_SIZE.observe(instance.size)
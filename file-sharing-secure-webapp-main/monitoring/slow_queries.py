@@ -0,0 +1,228 @@
+"""Log of slow database queries, with their query plans.
+
+SlowQueryMiddleware times every query a request runs. A query taking at
+least SLOW_QUERY_THRESHOLD seconds is, with probability
+SLOW_QUERY_SAMPLE_RATE, written to the 'monitoring.slow_queries' log with
+its duration, originating view, the project frame that ran it and the shape
+(types, not values) of its parameters. settings.SLOW_QUERY_LOG_FILE sends
+that log to a rotating file.
+
+Queries are also grouped by fingerprint, their SQL with literals and the
+length of IN lists and VALUES rows normalized, into SlowQuery rows for the
+admin. The first time a fingerprint is seen its query is EXPLAINed with the
+same parameters. Recording happens on a background thread with its own
+database connection, so it stays off the request path; that connection does
+not see the request's uncommitted writes. With SLOW_QUERY_EXPLAIN_ANALYZE
+it also runs under EXPLAIN ANALYZE (PostgreSQL and MySQL), inside a
+savepoint that is rolled back, so writes are undone.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from itertools import groupby
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connections, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .models import SlowQuery
+
+import hashlib
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MONITORING_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+NORMALIZE = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'(?<![\w."])-?\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s|%\(\w+\)s'), '?'),
+    (re.compile(r'\bIN \(\?(?:, \?)*\)', re.IGNORECASE), 'IN (...)'),
+    (re.compile(r'\(\?(?:, \?)*\)(?:, \(\?(?:, \?)*\))+'), '(...), ...'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def normalize_sql(sql):
+    """SQL with literals, placeholders, IN lists and extra VALUES rows reduced to markers"""
+    for pattern, replacement in NORMALIZE:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def fingerprint(sql):
+    return hashlib.sha1(normalize_sql(sql).encode()).hexdigest()
+
+
+def describe_params(params):
+    if params is None:
+        return ''
+    if isinstance(params, dict):
+        return '{' + ', '.join(f'{key}: {type(value).__name__}' for key, value in params.items()) + '}'
+    # Runs of one type, so a 500-item IN list reads 'int x 500'
+    runs = []
+    for name, group in groupby(type(value).__name__ for value in params):
+        count = sum(1 for _ in group)
+        runs.append(name if count == 1 else f'{name} x {count}')
+    return '(' + ', '.join(runs) + ')'
+
+
+def params_shape(params, many):
+    """Types of the parameters, never their values"""
+    if many:
+        params = list(params)
+        return f"{len(params)} x {describe_params(params[0]) if params else '()'}"
+    return describe_params(params)
+
+
+def caller_frame():
+    """'file:line in function' of the innermost project code below the query, or ''"""
+    base = str(settings.BASE_DIR) + os.sep
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(base) and not filename.startswith(MONITORING_DIR) and 'site-packages' not in filename:
+            return f"{os.path.relpath(filename, base)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return ''
+
+
+def get_view(request):
+    match = getattr(request, 'resolver_match', None)
+    return f"{request.method} {match.view_name if match is not None else request.path}"
+
+
+def explain(connection, sql, params, analyze):
+    """The query plan for sql as text, '' for statements that cannot be explained"""
+    statement = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+    if statement not in EXPLAINABLE or not connection.features.supports_explaining_query_execution:
+        return ''
+    options = {'analyze': True} if analyze and connection.vendor in ('postgresql', 'mysql') else {}
+    prefix = connection.ops.explain_query_prefix(**options)
+    try:
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(f'{prefix} {sql}', params)
+                rows = cursor.fetchall()
+            # EXPLAIN ANALYZE runs the statement; undo whatever it wrote
+            transaction.set_rollback(True, using=connection.alias)
+    except DatabaseError as error:
+        return f'EXPLAIN failed: {error}'
+    return '\n'.join(' '.join(str(column) for column in row) for row in rows)
+
+
+def record_slow_query(alias, sql, params, shape, duration, view, frame):
+    """Log a slow query and add it to its SlowQuery row, on this thread's connection"""
+    logger.warning(
+        "Slow query (%.1f ms) in %s at %s: %s -- params %s",
+        duration * 1000, view, frame or 'unknown', sql, shape or '()',
+    )
+
+    details = {
+        'params_shape': shape[:255],
+        'view': view[:255],
+        'frame': frame[:500],
+        'last_seen': timezone.now(),
+    }
+    queries = SlowQuery.objects.using(alias)
+    # Of several workers seeing a new fingerprint at once only one creates the
+    # row, and only that one pays for the EXPLAIN
+    row, created = queries.get_or_create(fingerprint=fingerprint(sql), defaults={
+        **details, 'sql': sql, 'total_duration': duration, 'max_duration': duration,
+    })
+    if created:
+        plan = explain(connections[alias], sql, params, settings.SLOW_QUERY_EXPLAIN_ANALYZE)
+        queries.filter(pk=row.pk).update(plan=plan)
+    else:
+        queries.filter(pk=row.pk).update(
+            count=F('count') + 1,
+            total_duration=F('total_duration') + duration,
+            max_duration=Greatest('max_duration', Value(duration)),
+            **details,
+        )
+
+
+class SlowQueryLog:
+    """Database execute wrapper handing a request's slow queries to the recorder thread.
+
+    The recorder runs record_slow_query on its own connection, which carries
+    none of the request's execute wrappers, so the EXPLAIN and SlowQuery
+    queries neither delay the request nor count towards its metrics and
+    query budget.
+    """
+    # Single background writer; slow queries are best effort
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='slow-query-log')
+    # Slow queries waiting for the recorder; more than this are dropped
+    pending = threading.BoundedSemaphore(100)
+
+    def __init__(self, request, threshold, sample_rate):
+        self.request = request
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = time.perf_counter() - start
+        if duration >= self.threshold and random.random() < self.sample_rate:
+            self.record(context['connection'], sql, params, many, duration)
+        return result
+
+    def record(self, connection, sql, params, many, duration):
+        if not self.pending.acquire(blocking=False):
+            return
+        shape = params_shape(params, many)
+        if many:
+            # EXPLAIN the first row of an executemany()
+            params = next(iter(params), None)
+        # Copied, as the caller may reuse its parameter list
+        if isinstance(params, dict):
+            params = dict(params)
+        elif params is not None:
+            params = list(params)
+        self.executor.submit(
+            self.run, connection.alias, sql, params, shape, duration, get_view(self.request), caller_frame()
+        )
+
+    def run(self, *args):
+        try:
+            record_slow_query(*args)
+        except Exception:
+            logger.exception("Could not record a slow query")
+        finally:
+            self.pending.release()
+            # This thread is not a request, so nothing else closes its connection
+            close_old_connections()
+
+
+class SlowQueryMiddleware:
+    """Record slow queries (see module docstring).
+
+    Like MetricsMiddleware it only sees queries run on the request's thread,
+    so under ASGI requests pass through unchecked.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self) or settings.SLOW_QUERY_SAMPLE_RATE <= 0:
+            return self.get_response(request)
+
+        log = SlowQueryLog(request, settings.SLOW_QUERY_THRESHOLD, settings.SLOW_QUERY_SAMPLE_RATE)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(log))
+            return self.get_response(request)
@@ -0,0 +1,114 @@
+"""Test helpers for query budgets (see monitoring.query_budget).
+
+    class DashboardBudgetTests(QueryBudgetMixin, TestCase):
+        def test_budgets(self):
+            self.assertQueryBudgets({
+                'dashboard_ops': (ops_client, '/dashboard-ops/'),
+                'download_link': (client, f'/api/download-file/{file.id}/'),
+                ...
+            })
+
+While a QueryBudgetMixin test runs, QUERY_BUDGET_ACTION is 'raise', so any
+request a test makes fails on an overrun, not just the ones checked here.
+"""
+from contextlib import ExitStack
+from urllib.parse import urlsplit
+from django.db import connections
+from django.test import override_settings
+from django.urls import URLResolver, get_resolver, resolve
+from .middleware import QueryRecorder
+from .query_budget import describe_overrun, get_query_budget
+
+
+def iter_urls(patterns=None, prefix=''):
+    """Yield (route, pattern) for every URL pattern of the URLconf, following include()s"""
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_urls(pattern.url_patterns, prefix + str(pattern.pattern))
+        else:
+            yield prefix + str(pattern.pattern), pattern
+
+
+def url_key(route, pattern):
+    return pattern.name or route
+
+
+def budgeted_urls():
+    """Map each URL's name (its route if unnamed) to its view's query budget, skipping URLs without one"""
+    budgets = {}
+    for route, pattern in iter_urls():
+        budget = get_query_budget(pattern.callback)
+        if budget is not None:
+            budgets.setdefault(url_key(route, pattern), budget)
+    return budgets
+
+
+def unbudgeted_urls(ignore=()):
+    """Routes whose views declare no query budget, except those starting with a prefix in ignore"""
+    return [
+        route for route, pattern in iter_urls()
+        if get_query_budget(pattern.callback) is None and not route.startswith(tuple(ignore))
+    ]
+
+
+class QueryBudgetMixin:
+    """TestCase mixin that raises on budget overruns and checks budgets URL by URL"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        override = override_settings(QUERY_BUDGET_ACTION='raise')
+        override.enable()
+        cls.addClassCleanup(override.disable)
+
+    def assertQueryBudget(self, path, client=None, method='get', **kwargs):
+        """Request path and fail if it runs more queries than its view's budget; return the response.
+
+        kwargs are passed to the client's request method, e.g. data.
+        """
+        match = resolve(urlsplit(path).path)
+        budget = get_query_budget(match.func, method)
+        if budget is None:
+            self.fail(f"The view for {path} declares no query budget")
+
+        recorder = QueryRecorder(keep_sql=True)
+        # Count the queries here, so the check does not depend on the middleware being installed
+        with override_settings(QUERY_BUDGET_ACTION='off'), ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = getattr(client or self.client, method)(path, **kwargs)
+            if response.streaming:
+                b''.join(response.streaming_content)
+
+        if recorder.count > budget:
+            request = response.wsgi_request
+            self.fail(describe_overrun(request, budget, recorder.queries))
+        return response
+
+    def assertQueryBudgets(self, cases):
+        """Check the budget of every budgeted URL.
+
+        cases maps URL names (routes for unnamed URLs) to (client, path)
+        or to a list of (client, method, path, data) requests. Budgeted URLs
+        missing from cases fail the test, so a new view cannot go unchecked.
+        Returns the responses, as a list per key.
+        """
+        missing = sorted(set(budgeted_urls()) - set(cases))
+        if missing:
+            self.fail(f"No query budget case for: {', '.join(missing)}")
+        responses = {}
+        for key, requests in cases.items():
+            if isinstance(requests, tuple):
+                client, path = requests
+                requests = [(client, 'get', path, None)]
+            responses[key] = []
+            for client, method, path, data in requests:
+                with self.subTest(url=key, method=method):
+                    if data is None:
+                        response = self.assertQueryBudget(path, client=client, method=method)
+                    else:
+                        response = self.assertQueryBudget(path, client=client, method=method, data=data)
+                    responses[key].append(response)
+        return responses
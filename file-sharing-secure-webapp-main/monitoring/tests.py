@@ -0,0 +1,187 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from files.models import UploadedFile, UploadSession
+from files.signing import sign_download_token
+from files.storage import blob_storage
+from files.synthetic import ooxml_document
+from files.upload_handlers import StagedUploadedFile
+from users.models import CustomUser
+from users.token_stores import get_token_store
+from users.views import serializer as email_serializer
+from .models import SlowQuery
+from .slow_queries import record_slow_query
+from .testing import QueryBudgetMixin, unbudgeted_urls
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+DOCX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+
+def docx(name='report.docx', seed=1):
+    return SimpleUploadedFile(name, ooxml_document(4096, seed, 'docx'), DOCX_CONTENT_TYPE)
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Every budgeted URL stays within its budget, with enough files to expose an N+1"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(
+            MEDIA_ROOT=media_root, RESUMABLE_UPLOAD_DIR=os.path.join(media_root, 'upload_sessions')
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.ops = CustomUser.objects.create_user(
+            username='ops', email='ops@example.com', password='ops-password', is_ops=True
+        )
+        self.client_user = CustomUser.objects.create_user(
+            username='client', email='client@example.com', password='client-password', is_client=True
+        )
+        self.files = [self.store_file(f'report-{i}.docx', i) for i in range(5)]
+
+        self.anonymous = Client()
+        self.ops_client = Client()
+        self.ops_client.force_login(self.ops)
+        self.client_client = Client()
+        self.client_client.force_login(self.client_user)
+
+    def store_file(self, name, seed):
+        content = ooxml_document(4096, seed, 'docx')
+        path, staged = blob_storage.create_staging_file()
+        with staged:
+            staged.write(content)
+        upload = StagedUploadedFile(
+            path, name, DOCX_CONTENT_TYPE, len(content), None, None, hashlib.sha256(content).hexdigest()
+        )
+        return UploadedFile.objects.create_from_upload(self.ops, upload)
+
+    def upload_session(self, content=b''):
+        session = UploadSession.objects.create(
+            uploader=self.ops, filename='deck.docx', content_type=DOCX_CONTENT_TYPE,
+            size=len(content) or 10, offset=len(content),
+        )
+        os.makedirs(os.path.dirname(session.part_path), exist_ok=True)
+        with open(session.part_path, 'wb') as part:
+            part.write(content)
+        return session
+
+    def test_every_url_has_a_budget(self):
+        self.assertEqual(unbudgeted_urls(ignore=['admin/']), [])
+
+    def test_budgets(self):
+        file_id = self.files[0].id
+        logout_client = Client()
+        logout_client.force_login(self.client_user)
+        # Its own user, since the login POSTs below retire the other users' tokens
+        magic_user = CustomUser.objects.create_user(username='magic', email='magic@example.com', is_client=True)
+        magic_token = get_token_store().create(magic_user, '127.0.0.1', 'tests').token
+        download_token, _ = sign_download_token(file_id)
+        session = self.upload_session()
+        complete = self.upload_session(ooxml_document(4096, 99, 'docx'))
+        email_form = {'email': self.client_user.email}
+        registration = {
+            'username': 'new', 'first_name': 'New', 'last_name': 'User',
+            'password1': 'a-Long-password-42', 'password2': 'a-Long-password-42',
+        }
+
+        responses = self.assertQueryBudgets({
+            'metrics': (self.anonymous, '/metrics'),
+            'home': (self.anonymous, '/'),
+            'login': [
+                (self.anonymous, 'get', '/login/', None),
+                (self.anonymous, 'post', '/login/', email_form),
+            ],
+            'logout': (logout_client, '/logout/'),
+            'dashboard_ops': [
+                (self.ops_client, 'get', '/dashboard-ops/', None),
+                (self.ops_client, 'post', '/dashboard-ops/', {'file': docx(seed=10)}),
+            ],
+            'dashboard_client': (self.client_client, '/dashboard-client/'),
+            'generate_link': (self.client_client, f'/generate-link/{file_id}/'),
+            'ops_login': [
+                (self.anonymous, 'get', '/ops-login/', None),
+                (self.anonymous, 'post', '/ops-login/', {'email': self.ops.email}),
+            ],
+            'client_login': [
+                (self.anonymous, 'get', '/client-login/', None),
+                (self.anonymous, 'post', '/client-login/', email_form),
+            ],
+            'magic_login': (Client(), f'/magic-login/{magic_token}/'),
+            'request_magic_login': [
+                (self.anonymous, 'get', '/request-magic-login/', None),
+                (self.anonymous, 'post', '/request-magic-login/', email_form),
+            ],
+            'ops_register': [
+                (self.anonymous, 'get', '/ops-register/', None),
+                (self.anonymous, 'post', '/ops-register/', {**registration, 'email': 'new-ops@example.com'}),
+            ],
+            'client_register': [
+                (self.anonymous, 'get', '/client-register/', None),
+                (self.anonymous, 'post', '/client-register/',
+                 {**registration, 'username': 'new-client', 'email': 'new-client@example.com'}),
+            ],
+            'client_signup': [(self.anonymous, 'post', '/api/signup/', {
+                'username': 'signup', 'email': 'signup@example.com', 'password': 'a-Long-password-42',
+            })],
+            'verify_email': (self.anonymous, f"/api/verify-email/{email_serializer.dumps('signup@example.com', salt='email-verify')}/"),
+            'api_login': [(self.anonymous, 'post', '/api/login/', {
+                'username': 'client', 'password': 'client-password',
+            })],
+            'api/upload/': [(self.ops_client, 'post', '/api/upload/', {'file': docx(seed=11)})],
+            'api/upload-sessions/': [(self.ops_client, 'post', '/api/upload-sessions/', {
+                'filename': 'deck.docx', 'content_type': DOCX_CONTENT_TYPE, 'size': 4096,
+            })],
+            'api/upload-sessions/<uuid:session_id>/': (self.ops_client, f'/api/upload-sessions/{session.id}/'),
+            'api/upload-sessions/<uuid:session_id>/finalize/': [
+                (self.ops_client, 'post', f'/api/upload-sessions/{complete.id}/finalize/', {}),
+            ],
+            'file_list': (self.client_client, '/api/list/'),
+            'download_link': (self.client_client, f'/api/download-file/{file_id}/'),
+            'secure_download': (self.client_client, f'/api/secure-download/{download_token}/'),
+            'bundle_download': (self.client_client, f"/api/bundle/?ids={','.join(str(f.id) for f in self.files)}"),
+        })
+
+        # Budgets only mean something for requests that did their work
+        for key, url_responses in responses.items():
+            for response in url_responses:
+                self.assertLess(response.status_code, 400, key)
+        self.assertEqual(responses['magic_login'][0].url, '/dashboard-client/')
+        self.assertEqual(UploadedFile.objects.count(), len(self.files) + 3)
+
+        # A chunk is a raw body, which assertQueryBudgets cannot send
+        response = self.assertQueryBudget(
+            f'/api/upload-sessions/{session.id}/', client=self.ops_client, method='patch',
+            data=b'0123456789', content_type='application/octet-stream', HTTP_UPLOAD_OFFSET='0',
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class SlowQueryTests(TestCase):
+    def test_repeated_fingerprint_is_explained_once(self):
+        sql = 'SELECT "users_customuser"."id" FROM "users_customuser" WHERE "users_customuser"."id" = %s'
+        with self.assertLogs('monitoring.slow_queries', 'WARNING'):
+            record_slow_query('default', sql, [1], '(int)', 0.5, 'GET home', 'views.py:1 in home')
+            record_slow_query('default', sql, [2], '(int)', 0.3, 'GET home', 'views.py:1 in home')
+
+        query = SlowQuery.objects.get()
+        self.assertEqual(query.count, 2)
+        self.assertAlmostEqual(query.total_duration, 0.8)
+        self.assertEqual(query.max_duration, 0.5)
+        self.assertTrue(query.plan)
+
+
+@override_settings(METRICS_ALLOWED_IPS=['127.0.0.1', '10.0.0.0/8'])
+class MetricsViewTests(TestCase):
+    def test_allowed_networks(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='192.168.1.5').status_code, 403)
+        # Only the peer address counts
+        response = self.client.get('/metrics', REMOTE_ADDR='192.168.1.5', HTTP_X_FORWARDED_FOR='10.1.2.3')
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+from prometheus_client import multiprocess
+from .query_budget import query_budget
+
+import ipaddress
+import os
+
+
+def is_scraper_allowed(address, allowed):
+    """Whether address is in METRICS_ALLOWED_IPS, whose entries are addresses or networks"""
+    if '*' in allowed:
+        return True
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(entry.strip(), strict=False) for entry in allowed if entry.strip())
+
+
+@query_budget(0)
+def metrics_view(request):
+    """Expose all metrics in the Prometheus text format"""
+    # The peer address, never X-Forwarded-For: scrapers connect to Django directly
+    if not is_scraper_allowed(request.META.get('REMOTE_ADDR', ''), settings.METRICS_ALLOWED_IPS):
+        return HttpResponseForbidden()
+
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # Aggregate the samples every worker has written to the shared directory
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
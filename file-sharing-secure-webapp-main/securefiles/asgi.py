@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "securefiles.settings")
+# Use the async file views, which stream downloads without holding a thread
+os.environ.setdefault("ASYNC_FILE_VIEWS", "True")
 
 application = get_asgi_application()
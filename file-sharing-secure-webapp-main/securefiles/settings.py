@@ -46,10 +46,15 @@ INSTALLED_APPS = [
     'rest_framework',
     'users',
     'files',
+    'monitoring',
     'rest_framework.authtoken'
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover every other middleware
+    "monitoring.middleware.MetricsMiddleware",
+    "monitoring.query_budget.QueryBudgetMiddleware",
+    "monitoring.slow_queries.SlowQueryMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -57,6 +62,8 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    # Needs request.user, and last so it profiles little besides the view
+    "monitoring.profiling.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "securefiles.urls"
@@ -65,13 +72,23 @@ TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
-        "APP_DIRS": True,
         "OPTIONS": {
             "context_processors": [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
             ],
+            # Compile each template once per process, also under DEBUG
+            # (the development server clears the cache when a template changes)
+            "loaders": [
+                (
+                    "django.template.loaders.cached.Loader",
+                    [
+                        "django.template.loaders.filesystem.Loader",
+                        "django.template.loaders.app_directories.Loader",
+                    ],
+                ),
+            ],
         },
     },
 ]
@@ -143,18 +160,152 @@ AUTH_USER_MODEL = 'users.CustomUser'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ]
 }
 
+# API token -> user lookups are cached per process for AUTH_CACHE_LOCAL_TTL
+# seconds and, when CACHES is shared (REDIS_URL), there for AUTH_CACHE_TIMEOUT seconds
+AUTH_CACHE_LOCAL_SIZE = int(os.getenv('AUTH_CACHE_LOCAL_SIZE', '10000'))
+AUTH_CACHE_LOCAL_TTL = int(os.getenv('AUTH_CACHE_LOCAL_TTL', '5'))
+AUTH_CACHE_TIMEOUT = int(os.getenv('AUTH_CACHE_TIMEOUT', '60'))
+
+# Shared cache for rate limits and cached lookups. Without REDIS_URL each
+# process has its own local-memory cache, so limits apply per process.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Magic login tokens: users.token_stores.DatabaseTokenStore keeps them in the
+# database, users.token_stores.CacheTokenStore in CACHES with native expiry
+# (use it with REDIS_URL when running several processes)
+MAGIC_TOKEN_STORE = os.getenv('MAGIC_TOKEN_STORE', 'users.token_stores.DatabaseTokenStore')
+# Seconds a magic login link stays valid
+MAGIC_TOKEN_LIFETIME = 3600
+# With the cache store, also record tokens as MagicLoginToken rows in the background
+MAGIC_TOKEN_AUDIT = os.getenv('MAGIC_TOKEN_AUDIT', 'False').lower() == 'true'
+
+# Reverse proxies in front of Django that append the client address to X-Forwarded-For
+# (1 behind the bundled nginx). With 0, REMOTE_ADDR is the client address.
+TRUSTED_PROXY_COUNT = int(os.getenv('TRUSTED_PROXY_COUNT', '0'))
+
+# POSTs allowed in each sliding window (seconds) per client IP, per account (email
+# address or username) from one IP, and per account from all IPs (see users/ratelimit.py)
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True').lower() == 'true'
+RATE_LIMITS = {
+    'login': {
+        'per_ip': int(os.getenv('LOGIN_RATE_LIMIT_PER_IP', '20')),
+        'per_account': int(os.getenv('LOGIN_RATE_LIMIT_PER_EMAIL', '5')),
+        'per_account_total': int(os.getenv('LOGIN_RATE_LIMIT_PER_EMAIL_TOTAL', '50')),
+        'window': 300,
+    },
+    # Password login to the API
+    'api_login': {
+        'per_ip': int(os.getenv('LOGIN_RATE_LIMIT_PER_IP', '20')),
+        'per_account': int(os.getenv('LOGIN_RATE_LIMIT_PER_EMAIL', '5')),
+        'per_account_total': int(os.getenv('LOGIN_RATE_LIMIT_PER_EMAIL_TOTAL', '50')),
+        'account_field': 'username',
+        'window': 300,
+    },
+    'signup': {
+        'per_ip': int(os.getenv('SIGNUP_RATE_LIMIT_PER_IP', '10')),
+        'per_account': 3,
+        'per_account_total': 20,
+        'window': 3600,
+    },
+}
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# FileUploadView and dashboard_ops stream uploads once to their final location and
+# validate them while they are written (files.upload_handlers.StreamingUploadHandler)
+UPLOAD_MAX_SIZE = int(os.getenv('UPLOAD_MAX_SIZE', str(100 * 1024 * 1024)))
+
+# Serve the file list/link/download API with async views (set by asgi.py)
+ASYNC_FILE_VIEWS = os.getenv('ASYNC_FILE_VIEWS', 'False').lower() == 'true'
+
+# How SecureDownloadView delivers file bytes:
+# 'stream' (Django streams the file), 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache/lighttpd)
+SECURE_DOWNLOAD_MODE = os.getenv('SECURE_DOWNLOAD_MODE', 'stream')
+# Internal nginx location that maps onto MEDIA_ROOT (see nginx.conf)
+SECURE_DOWNLOAD_ACCEL_PREFIX = os.getenv('SECURE_DOWNLOAD_ACCEL_PREFIX', '/protected-media/')
+
+# Signed download links: "key-id:secret" pairs, comma separated, with key ids made of
+# letters, digits, "-" and "_" (checked by files/checks.py). New links are signed with
+# DOWNLOAD_LINK_KEY_ID; keep retired keys listed until their links expire. Without
+# DOWNLOAD_LINK_KEYS there is one key, "default", with DOWNLOAD_LINK_SECRET as its secret.
+DOWNLOAD_LINK_KEYS = dict(
+    pair.partition(':')[::2] for pair in os.getenv('DOWNLOAD_LINK_KEYS', '').split(',') if pair
+) or {'default': os.getenv('DOWNLOAD_LINK_SECRET', SECRET_KEY)}
+DOWNLOAD_LINK_KEY_ID = os.getenv('DOWNLOAD_LINK_KEY_ID', next(iter(DOWNLOAD_LINK_KEYS)))
+DOWNLOAD_LINK_MAX_AGE = int(os.getenv('DOWNLOAD_LINK_MAX_AGE', '3600'))
+# Seconds between reloads of the revoked-link list in each process
+DOWNLOAD_LINK_REVOCATION_REFRESH = int(os.getenv('DOWNLOAD_LINK_REVOCATION_REFRESH', '30'))
+
+# What to do when a request runs more queries than its view's query_budget:
+# 'log', 'raise' or 'off' (see monitoring/query_budget.py)
+QUERY_BUDGET_ACTION = os.getenv('QUERY_BUDGET_ACTION', 'log' if DEBUG else 'off')
+
+# On-demand profiling of staff requests (X-Profile header or ?_profile=1), see monitoring/profiling.py
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'True').lower() == 'true'
+# Seconds between stack samples of a profiled request
+PROFILING_SAMPLE_INTERVAL = float(os.getenv('PROFILING_SAMPLE_INTERVAL', '0.005'))
+# Number of stored profiles to keep; older ones are deleted
+PROFILING_KEEP = int(os.getenv('PROFILING_KEEP', '100'))
+
+# Slow-query log, see monitoring/slow_queries.py
+# Queries taking at least this many seconds are slow
+SLOW_QUERY_THRESHOLD = float(os.getenv('SLOW_QUERY_THRESHOLD', '0.2'))
+# Fraction of slow queries recorded; 0 turns the log off. Every one in development, one in ten in production
+SLOW_QUERY_SAMPLE_RATE = float(os.getenv('SLOW_QUERY_SAMPLE_RATE', '1.0' if DEBUG else '0.1'))
+# Capture plans with EXPLAIN ANALYZE, which runs the query again (PostgreSQL and MySQL only)
+SLOW_QUERY_EXPLAIN_ANALYZE = os.getenv('SLOW_QUERY_EXPLAIN_ANALYZE', 'False').lower() == 'true'
+# Also write each slow query to this file, rotated at 10 MB with 5 backups
+SLOW_QUERY_LOG_FILE = os.getenv('SLOW_QUERY_LOG_FILE', '')
+if SLOW_QUERY_LOG_FILE:
+    LOGGING = {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'handlers': {
+            'slow_queries': {
+                'class': 'logging.handlers.RotatingFileHandler',
+                'filename': SLOW_QUERY_LOG_FILE,
+                'maxBytes': 10 * 1024 * 1024,
+                'backupCount': 5,
+            },
+        },
+        'loggers': {
+            'monitoring.slow_queries': {'handlers': ['slow_queries'], 'level': 'WARNING'},
+        },
+    }
+
+# Clients allowed to scrape /metrics, as addresses or networks (10.0.0.0/8); '*' allows everyone
+METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+# Maximum number of files in one streamed ZIP bundle
+BUNDLE_MAX_FILES = int(os.getenv('BUNDLE_MAX_FILES', '100'))
+
+# Resumable uploads: part files are kept outside MEDIA_ROOT so they are never served
+RESUMABLE_UPLOAD_DIR = os.getenv('RESUMABLE_UPLOAD_DIR', str(BASE_DIR / 'upload_sessions'))
+# Seconds without a chunk after which a session expires; cleanup_upload_sessions removes it
+UPLOAD_SESSION_MAX_AGE = int(os.getenv('UPLOAD_SESSION_MAX_AGE', str(24 * 3600)))
+
 # Email Configuration
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+EMAIL_BACKEND = 'users.email_backends.PooledSMTPBackend'
 
 # Environment variables for email configuration (recommended for security)
 EMAIL_HOST = os.getenv('EMAIL_HOST', 'smtp.gmail.com')
@@ -172,6 +323,22 @@ DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'Secure File Share <noreply
 # Email timeout settings
 EMAIL_TIMEOUT = 30
 
+# PooledSMTPBackend: open connections kept per process, and send attempts per
+# message; retries after a connection error wait a jittered, doubling delay
+EMAIL_POOL_SIZE = int(os.getenv('EMAIL_POOL_SIZE', '4'))
+EMAIL_SEND_RETRIES = int(os.getenv('EMAIL_SEND_RETRIES', '3'))
+EMAIL_RETRY_DELAY = float(os.getenv('EMAIL_RETRY_DELAY', '0.5'))
+EMAIL_MAX_RETRY_DELAY = float(os.getenv('EMAIL_MAX_RETRY_DELAY', '10'))
+
+# Email outbox worker (python manage.py send_outbox --loop)
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv('EMAIL_OUTBOX_BATCH_SIZE', '50'))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', '8'))
+# First retry waits this many seconds, doubling after each failure up to the maximum
+EMAIL_OUTBOX_RETRY_DELAY = int(os.getenv('EMAIL_OUTBOX_RETRY_DELAY', '30'))
+EMAIL_OUTBOX_MAX_RETRY_DELAY = int(os.getenv('EMAIL_OUTBOX_MAX_RETRY_DELAY', '3600'))
+# How long a worker holds claimed messages before another worker may retry them
+EMAIL_OUTBOX_LEASE = int(os.getenv('EMAIL_OUTBOX_LEASE', '600'))
+
 LOGIN_URL = '/login/'
 
 APPEND_SLASH = True
@@ -2,12 +2,11 @@ from django.contrib import admin
 from django.urls import path, include
 from users.views import user_login, user_logout, dashboard_ops, dashboard_client, home
 from files.views import generate_secure_link
-
-from django.conf import settings
-from django.conf.urls.static import static
+from monitoring.views import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     
     # Home page
     path('', home, name='home'),
@@ -22,4 +21,4 @@ urlpatterns = [
     # Include app URLs
     path('', include('users.urls')),
     path('api/', include('files.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
@@ -1,8 +1,11 @@
 from django.contrib import admin
-from .models import CustomUser, MagicLoginToken
+from django.utils import timezone
+from .forms import CustomUserAdminForm
+from .models import CustomUser, MagicLoginToken, OutboxEmail
 
 @admin.register(CustomUser)
 class CustomUserAdmin(admin.ModelAdmin):
+    form = CustomUserAdminForm
     list_display = ['username', 'email', 'first_name', 'last_name', 'is_ops', 'is_client', 'is_active', 'date_joined']
     list_filter = ['is_ops', 'is_client', 'is_active', 'email_verified', 'date_joined']
     search_fields = ['username', 'email', 'first_name', 'last_name']
@@ -47,3 +50,23 @@ class MagicLoginTokenAdmin(admin.ModelAdmin):
             'fields': ('login_ip', 'user_agent')
         }),
     )
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'recipient_list', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['subject', 'recipients']
+    readonly_fields = ['created_at', 'sent_at', 'last_error']
+    ordering = ['-created_at']
+    actions = ['retry_now']
+
+    def recipient_list(self, obj):
+        return ', '.join(obj.recipients)
+    recipient_list.short_description = 'Recipients'
+
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status=OutboxEmail.SENT).update(
+            status=OutboxEmail.PENDING, attempts=0, next_attempt_at=timezone.now()
+        )
+        self.message_user(request, f"{updated} emails queued for another attempt")
+    retry_now.short_description = 'Retry selected emails now'
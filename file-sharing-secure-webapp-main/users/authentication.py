@@ -0,0 +1,169 @@
+"""Token authentication that answers steady-state requests without queries.
+
+Two lookups are cached, each in a small process-local LRU in front of the
+Django cache:
+
+* token key -> user id, dropped when the token is deleted;
+* user id -> the fields permission checks read (is_active, is_ops, ...),
+  dropped when the user is saved or deleted.
+
+Signals clear the shared cache and this process's LRU. Other processes keep
+their local copy for at most AUTH_CACHE_LOCAL_TTL seconds, and the shared
+entries expire after AUTH_CACHE_TIMEOUT as a backstop for updates that skip
+signals (call forget_user() after QuerySet.update() on users).
+
+The Django cache is only used when other processes share it (e.g. Redis).
+A local-memory cache could not be cleared from other workers, so without one
+lookups are cached in the LRU alone and every change applies everywhere
+within AUTH_CACHE_LOCAL_TTL seconds.
+"""
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from .models import CustomUser
+
+import threading
+import time
+
+# User fields kept in the cache; anything else is loaded on first access
+CACHED_USER_FIELDS = (
+    'id', 'username', 'is_active', 'is_staff', 'is_superuser', 'is_ops', 'is_client', 'email_verified'
+)
+
+
+class LocalCache:
+    """Thread-safe LRU with a per-entry time to live"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_users = LocalCache(settings.AUTH_CACHE_LOCAL_SIZE, settings.AUTH_CACHE_LOCAL_TTL)
+user_fields = LocalCache(settings.AUTH_CACHE_LOCAL_SIZE, settings.AUTH_CACHE_LOCAL_TTL)
+
+
+def get_shared_cache():
+    """The default cache if other processes see it too, else None"""
+    cache = caches['default']
+    return None if isinstance(cache, (LocMemCache, DummyCache)) else cache
+
+
+def token_cache_key(key):
+    return f"users:token:{key}"
+
+
+def user_cache_key(user_id):
+    return f"users:auth-user:{user_id}"
+
+
+def get_token_user_id(key):
+    """Return the id of the user owning a token key, or None if there is no such token"""
+    user_id = token_users.get(key)
+    if user_id is None:
+        cache = get_shared_cache()
+        if cache is not None:
+            user_id = cache.get(token_cache_key(key))
+        if user_id is None:
+            user_id = Token.objects.filter(key=key).values_list('user_id', flat=True).first()
+            if user_id is None:
+                return None
+            if cache is not None:
+                cache.set(token_cache_key(key), user_id, settings.AUTH_CACHE_TIMEOUT)
+        token_users.set(key, user_id)
+    return user_id
+
+
+def get_auth_user(user_id):
+    """Return a CustomUser with CACHED_USER_FIELDS loaded and the rest deferred, or None"""
+    fields = user_fields.get(user_id)
+    if fields is None:
+        cache = get_shared_cache()
+        if cache is not None:
+            fields = cache.get(user_cache_key(user_id))
+        if fields is None:
+            fields = CustomUser.objects.filter(id=user_id).values(*CACHED_USER_FIELDS).first()
+            if fields is None:
+                return None
+            if cache is not None:
+                cache.set(user_cache_key(user_id), fields, settings.AUTH_CACHE_TIMEOUT)
+        user_fields.set(user_id, fields)
+
+    # from_db() takes the values in model field order and defers the fields left out
+    names = [f.attname for f in CustomUser._meta.concrete_fields if f.attname in fields]
+    return CustomUser.from_db(None, names, [fields[name] for name in names])
+
+
+def get_token_user(key):
+    """Return the active user a token key belongs to, or None"""
+    user_id = get_token_user_id(key)
+    if user_id is None:
+        return None
+    user = get_auth_user(user_id)
+    if user is None or not user.is_active:
+        return None
+    return user
+
+
+def forget_token(key):
+    token_users.delete(key)
+    cache = get_shared_cache()
+    if cache is not None:
+        cache.delete(token_cache_key(key))
+
+
+def forget_user(user_id):
+    user_fields.delete(user_id)
+    cache = get_shared_cache()
+    if cache is not None:
+        cache.delete(user_cache_key(user_id))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Drop-in replacement for TokenAuthentication backed by the caches above"""
+
+    def authenticate_credentials(self, key):
+        user_id = get_token_user_id(key)
+        if user_id is None:
+            raise exceptions.AuthenticationFailed('Invalid token.')
+
+        user = get_auth_user(user_id)
+        if user is None or not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+
+        # Unsaved stand-in for the token row; only key and user_id are known
+        return user, Token(key=key, user_id=user_id)
@@ -0,0 +1,190 @@
+"""SMTP backend that keeps authenticated connections open between sends.
+
+Django's SMTP backend opens a TCP connection, negotiates TLS and logs in for
+every send_mail() call. PooledSMTPBackend keeps up to EMAIL_POOL_SIZE open
+connections per process and hands them out to callers, so the handshake is
+paid once per connection instead of once per message. A connection that
+fails is dropped and replaced after a jittered backoff.
+
+Each pooled connection is a plain Django SMTP EmailBackend, so every EMAIL_*
+setting applies unchanged.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.backends.smtp import EmailBackend as SMTPBackend
+from monitoring.metrics import EMAIL_SEND_DURATION
+
+import queue
+import random
+import smtplib
+import threading
+import time
+
+
+def backoff_delay(attempt, base=None, cap=None):
+    """Seconds to wait before retry number attempt (0-based), with full jitter"""
+    base = settings.EMAIL_RETRY_DELAY if base is None else base
+    cap = settings.EMAIL_MAX_RETRY_DELAY if cap is None else cap
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def is_connection_error(error):
+    """Whether error means the connection is unusable, as opposed to the server rejecting a message.
+
+    Every smtplib exception is an OSError, so a refused recipient or a failed
+    login has to be told apart from a dropped socket.
+    """
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+class SMTPConnectionPool:
+    """A bounded set of open SMTP connections shared by the threads of a process"""
+
+    def __init__(self, size, **connection_kwargs):
+        self.size = size
+        self.connection_kwargs = connection_kwargs
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+
+    def acquire(self):
+        """Return an open connection, waiting if all of them are in use"""
+        self.slots.acquire()
+        try:
+            connection = self.idle.get_nowait()
+        except queue.Empty:
+            connection = SMTPBackend(fail_silently=False, **self.connection_kwargs)
+        try:
+            # No-op for a connection that is already open
+            connection.open()
+        except BaseException:
+            self.slots.release()
+            raise
+        return connection
+
+    def release(self, connection, broken=False):
+        if broken:
+            try:
+                connection.close()
+            except Exception:
+                pass
+            # A fresh backend is created for the slot on the next acquire()
+        else:
+            self.idle.put(connection)
+        self.slots.release()
+
+    def close(self):
+        while True:
+            try:
+                connection = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+
+class PooledSMTPBackend(BaseEmailBackend):
+    """Email backend sending over a per-process pool of persistent SMTP connections"""
+
+    pools = {}
+    pools_lock = threading.Lock()
+
+    def __init__(self, host=None, port=None, username=None, password=None, use_tls=None,
+                 fail_silently=False, use_ssl=None, timeout=None, **kwargs):
+        super().__init__(fail_silently=fail_silently)
+        self.connection_kwargs = {
+            'host': host, 'port': port, 'username': username, 'password': password,
+            'use_tls': use_tls, 'use_ssl': use_ssl, 'timeout': timeout,
+        }
+        self.retries = settings.EMAIL_SEND_RETRIES
+        self.pool = self.get_pool(settings.EMAIL_POOL_SIZE, self.connection_kwargs)
+
+    @classmethod
+    def get_pool(cls, size, connection_kwargs):
+        key = tuple(sorted(connection_kwargs.items()))
+        with cls.pools_lock:
+            if key not in cls.pools:
+                cls.pools[key] = SMTPConnectionPool(size, **connection_kwargs)
+            return cls.pools[key]
+
+    @classmethod
+    def close_pools(cls):
+        with cls.pools_lock:
+            for pool in cls.pools.values():
+                pool.close()
+            cls.pools.clear()
+
+    def open(self):
+        # Connections are opened on demand and outlive this backend instance
+        return False
+
+    def close(self):
+        pass
+
+    def send_one(self, message):
+        """Send a message, reconnecting on connection errors. Raises the last error."""
+        start = time.perf_counter()
+        outcome = 'failed'
+        try:
+            sent = self.send_with_retries(message)
+            outcome = 'sent'
+            return sent
+        finally:
+            EMAIL_SEND_DURATION.labels(outcome).observe(time.perf_counter() - start)
+
+    def send_with_retries(self, message):
+        for attempt in range(self.retries):
+            try:
+                connection = self.pool.acquire()
+            except Exception as error:
+                if not is_connection_error(error) or attempt == self.retries - 1:
+                    raise
+                time.sleep(backoff_delay(attempt))
+                continue
+
+            try:
+                sent = connection.send_messages([message])
+            except BaseException as error:
+                if not is_connection_error(error):
+                    # The server rejected this message; the connection itself is fine
+                    self.pool.release(connection)
+                    raise
+                self.pool.release(connection, broken=True)
+                if attempt == self.retries - 1:
+                    raise
+                time.sleep(backoff_delay(attempt))
+            else:
+                self.pool.release(connection)
+                return sent
+        return 0
+
+    def send_batch(self, email_messages):
+        """Send messages concurrently over the pool.
+
+        Returns one entry per message: None if it was sent, otherwise the
+        exception that stopped it.
+        """
+        def send(message):
+            try:
+                self.send_one(message)
+            except Exception as e:
+                return e
+            return None
+
+        if len(email_messages) <= 1:
+            return [send(message) for message in email_messages]
+        with ThreadPoolExecutor(max_workers=min(self.pool.size, len(email_messages))) as executor:
+            return list(executor.map(send, email_messages))
+
+    def send_messages(self, email_messages):
+        if not email_messages:
+            return 0
+        errors = self.send_batch(list(email_messages))
+        failures = [error for error in errors if error is not None]
+        if failures and not self.fail_silently:
+            raise failures[0]
+        return len(errors) - len(failures)
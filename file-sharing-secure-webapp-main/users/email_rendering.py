@@ -0,0 +1,36 @@
+"""Rendering of multipart emails from precompiled templates.
+
+Each email is a pair of templates, ``emails/<name>.html`` and
+``emails/<name>.txt``. They are looked up and compiled once per process and
+both parts are rendered from a single Context, so rendering a message costs
+two node-tree walks and nothing else.
+"""
+from functools import lru_cache
+from django.template import Context
+from django.template.loader import get_template
+
+
+class EmailTemplate:
+    def __init__(self, name):
+        # The compiled django.template.base.Template behind each backend template
+        self.html = get_template(f'emails/{name}.html').template
+        self.text = get_template(f'emails/{name}.txt').template
+
+    def render(self, context):
+        """Return (plain_text, html) for the given context dict"""
+        context = Context(context)
+        html = self.html.render(context)
+        # The text part is not HTML; escaping would mangle values such as user agents
+        context.autoescape = False
+        text = self.text.render(context)
+        return text, html
+
+
+@lru_cache(maxsize=None)
+def get_email_template(name):
+    return EmailTemplate(name)
+
+
+def render_email(name, context):
+    """Render the text and HTML parts of the named email; returns (plain_text, html)"""
+    return get_email_template(name).render(context)
@@ -1,6 +1,8 @@
 from django.core.mail import send_mail
 from django.conf import settings
 from django.template.loader import render_to_string
+from .email_backends import backoff_delay
+import time
 import traceback
 
 def test_email_configuration():
@@ -63,6 +65,7 @@ def send_email_with_retry(subject, message, recipient_list, html_message=None, m
         except Exception as e:
             if attempt < max_retries - 1:
                 print(f"Email attempt {attempt + 1} failed: {str(e)}. Retrying...")
+                time.sleep(backoff_delay(attempt))
                 continue
             else:
                 error_msg = f"Failed to send email after {max_retries} attempts: {str(e)}"
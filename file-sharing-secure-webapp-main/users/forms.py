@@ -1,8 +1,30 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
-from .models import CustomUser
+from .models import CustomUser, normalize_email_address
 
-class OpsUserRegistrationForm(UserCreationForm):
+class UniqueEmailMixin:
+    """Reject an email address already registered to another user, ignoring case"""
+
+    def clean_email(self):
+        email = self.cleaned_data['email']
+        normalized = normalize_email_address(email)
+        if not normalized:
+            return email
+        users = CustomUser.objects.filter(email_normalized=normalized)
+        if self.instance.pk is not None:
+            users = users.exclude(pk=self.instance.pk)
+        if users.exists():
+            raise forms.ValidationError("A user with this email address already exists.")
+        return email
+
+class CustomUserAdminForm(UniqueEmailMixin, forms.ModelForm):
+    """Admin add and change form; email_normalized is not editable, so check it here"""
+
+    class Meta:
+        model = CustomUser
+        fields = '__all__'
+
+class OpsUserRegistrationForm(UniqueEmailMixin, UserCreationForm):
     email = forms.EmailField(required=True)
     first_name = forms.CharField(max_length=30, required=True)
     last_name = forms.CharField(max_length=30, required=True)
@@ -24,7 +46,7 @@ class OpsUserRegistrationForm(UserCreationForm):
             user.save()
         return user
 
-class ClientUserRegistrationForm(UserCreationForm):
+class ClientUserRegistrationForm(UniqueEmailMixin, UserCreationForm):
     email = forms.EmailField(required=True)
     first_name = forms.CharField(max_length=30, required=True)
     last_name = forms.CharField(max_length=30, required=True)
@@ -0,0 +1,313 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import lru_cache
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from files.models import Blob, UploadedFile
+from files.storage import blob_storage
+from files.synthetic import ooxml_document, parse_size
+from files.validators import detect_content_type
+from rest_framework.authtoken.models import Token
+from users.models import CustomUser, MagicLoginToken, normalize_email_address
+
+import hashlib
+import os
+import random
+import time
+import uuid
+
+EXTENSIONS = ('xlsx', 'docx', 'pptx')
+
+# Random bytes at the end of each sparse blob, which make its content unique
+SPARSE_TAIL_SIZE = 16
+
+# Chance that a file was uploaded in the same instant as the one before, as
+# several files of one request are; the list API then orders them by id
+BURST_PROBABILITY = 0.1
+
+
+@lru_cache(maxsize=None)
+def zeros_hash(size):
+    """SHA-256 state after size zero bytes; copy() it before updating"""
+    digest = hashlib.sha256()
+    chunk = bytes(min(size, 1024 * 1024))
+    remaining = size
+    while remaining:
+        digest.update(chunk[:remaining])
+        remaining -= min(remaining, len(chunk))
+    return digest
+
+
+def write_sparse_blob(size):
+    """Store a blob of zeros ending in random bytes; return its SHA-256.
+
+    Only the tail is written, so the file takes a block or two on disk
+    whatever its size, and the hash of the zeros is computed once per size.
+    """
+    tail = os.urandom(min(size, SPARSE_TAIL_SIZE))
+    digest = zeros_hash(size - len(tail)).copy()
+    digest.update(tail)
+    path, staged = blob_storage.create_staging_file()
+    with staged:
+        staged.seek(size - len(tail))
+        staged.write(tail)
+    sha256 = digest.hexdigest()
+    blob_storage.ingest(path, sha256)
+    return sha256
+
+
+def upload_times(count, days):
+    """Ascending upload times spread over the last days days, some files sharing one"""
+    now = timezone.now()
+    span = days * 24 * 3600
+    previous = None
+    for offset in sorted(random.uniform(0, span) for _ in range(count)):
+        if previous is None or random.random() >= BURST_PROBABILITY:
+            previous = now - timedelta(seconds=span - offset)
+        yield previous
+
+
+@contextmanager
+def explicit_upload_times():
+    """Make bulk_create() keep the uploaded_at it is given instead of stamping the current time"""
+    field = UploadedFile._meta.get_field('uploaded_at')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def write_ooxml_blob(size, extension):
+    """Store a small valid OOXML package; return its SHA-256 and actual size"""
+    content = ooxml_document(size, os.urandom(16), extension)
+    path, staged = blob_storage.create_staging_file()
+    with staged:
+        staged.write(content)
+    sha256 = hashlib.sha256(content).hexdigest()
+    blob_storage.ingest(path, sha256)
+    return sha256, len(content)
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic users, files, magic login tokens and API tokens for scale testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=100,
+            help='Client users to create (default: 100)',
+        )
+        parser.add_argument(
+            '--ops-users',
+            type=int,
+            default=5,
+            help='Operations users to create; they upload the files (default: 5)',
+        )
+        parser.add_argument(
+            '--files',
+            type=int,
+            default=1000,
+            help='UploadedFile rows to create (default: 1000)',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=365,
+            help='Spread the files\' upload times over this many days up to now (default: 365)',
+        )
+        parser.add_argument(
+            '--blobs',
+            type=int,
+            help='Distinct file contents shared by the files (default: one per file)',
+        )
+        parser.add_argument(
+            '--content',
+            choices=('sparse', 'ooxml'),
+            default='sparse',
+            help='sparse: zero-filled sparse files, cheap at any size; '
+                 'ooxml: small valid Office documents (default: sparse)',
+        )
+        parser.add_argument(
+            '--file-size',
+            default='64k',
+            help='Size of each blob, e.g. 4k or 2m (default: 64k)',
+        )
+        parser.add_argument(
+            '--magic-tokens',
+            type=int,
+            default=0,
+            help='Magic login tokens per user, a mix of unused, used and expired (default: 0)',
+        )
+        parser.add_argument(
+            '--api-tokens',
+            action='store_true',
+            help='Create an API token for every new user',
+        )
+        parser.add_argument(
+            '--password',
+            default='password123',
+            help='Password of every new user, hashed once (default: password123)',
+        )
+        parser.add_argument(
+            '--prefix',
+            default='synthetic',
+            help='Username prefix, so generated users are easy to find and delete (default: synthetic)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows per INSERT (default: 5000)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Threads writing blob files (default: 8)',
+        )
+
+    def handle(self, *args, **options):
+        if options['files'] and not options['ops_users']:
+            raise CommandError('Files need at least one --ops-users to upload them')
+        self.batch_size = options['batch_size']
+        self.started = time.monotonic()
+
+        # Hashing takes far longer than inserting a row, so every user shares one hash
+        password = make_password(options['password'])
+        prefix = options['prefix']
+        ops_ids = self.create_users(f'{prefix}-ops', options['ops_users'], password, is_ops=True)
+        client_ids = self.create_users(f'{prefix}-client', options['users'], password, is_client=True)
+
+        if options['files']:
+            blobs = self.create_blobs(
+                min(options['blobs'] or options['files'], options['files']),
+                options['files'],
+                options['content'],
+                parse_size(options['file_size']),
+                options['workers'],
+            )
+            self.create_files(options['files'], blobs, ops_ids, prefix, options['days'])
+        if options['magic_tokens']:
+            self.create_magic_tokens(ops_ids + client_ids, options['magic_tokens'])
+        if options['api_tokens']:
+            user_ids = ops_ids + client_ids
+            self.bulk_create(Token, (Token(user_id=user_id, key=Token.generate_key()) for user_id in user_ids))
+            self.report(f'Created {len(user_ids)} API tokens')
+
+        self.stdout.write(self.style.SUCCESS(f'Done in {time.monotonic() - self.started:.1f}s'))
+
+    def report(self, message):
+        self.stdout.write(f'[{time.monotonic() - self.started:7.1f}s] {message}')
+
+    def batches(self, objects):
+        batch = []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def bulk_create(self, model, objects):
+        for batch in self.batches(objects):
+            with transaction.atomic():
+                model.objects.bulk_create(batch, batch_size=self.batch_size)
+
+    def create_users(self, name_prefix, count, password, **flags):
+        """Create count users named <name_prefix>-<n>, continuing after earlier runs; return their IDs"""
+        start = CustomUser.objects.filter(username__startswith=f'{name_prefix}-').count()
+        names = [f'{name_prefix}-{n}' for n in range(start, start + count)]
+
+        def users():
+            for name in names:
+                email = f'{name}@example.com'
+                # bulk_create() skips save(), which is what normally fills email_normalized
+                yield CustomUser(
+                    username=name,
+                    email=email,
+                    email_normalized=normalize_email_address(email),
+                    email_verified=True,
+                    password=password,
+                    **flags,
+                )
+
+        self.bulk_create(CustomUser, users())
+        ids = []
+        for batch in self.batches(names):
+            ids.extend(CustomUser.objects.filter(username__in=batch).values_list('id', flat=True))
+        self.report(f'Created {count} users named {name_prefix}-*')
+        return ids
+
+    def create_blobs(self, count, files, content, size, workers):
+        """Write count blob files in parallel and record them; return (sha256, size, extension) per blob"""
+        def write(index):
+            extension = EXTENSIONS[index % len(EXTENSIONS)]
+            if content == 'sparse':
+                return write_sparse_blob(size), size, extension
+            return (*write_ooxml_blob(size, extension), extension)
+
+        blobs = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for batch in self.batches(range(count)):
+                written = list(executor.map(write, batch))
+                # Files are spread evenly over the blobs, so every reference count is known up front
+                rows = [
+                    Blob(sha256=sha256, size=blob_size, ref_count=files // count + (index < files % count))
+                    for index, (sha256, blob_size, _) in zip(batch, written)
+                ]
+                with transaction.atomic():
+                    Blob.objects.bulk_create(rows, batch_size=self.batch_size)
+                blobs.extend(written)
+                self.report(f'Wrote {len(blobs)}/{count} {content} blobs')
+        return blobs
+
+    def create_files(self, count, blobs, uploader_ids, prefix, days):
+        def files():
+            # Spread over time, so keyset pagination and date filters see realistic data
+            for n, uploaded_at in enumerate(upload_times(count, days)):
+                sha256, size, extension = blobs[n % len(blobs)]
+                name = f'{prefix}-report-{n}.{extension}'
+                # bulk_create() skips create_from_upload(), so every derived column is set here
+                yield UploadedFile(
+                    uploader_id=uploader_ids[n % len(uploader_ids)],
+                    file=blob_storage.blob_name(sha256),
+                    blob_id=sha256,
+                    sha256=sha256,
+                    original_name=name,
+                    extension=extension,
+                    size=size,
+                    content_type=detect_content_type(name),
+                    secure_token=str(uuid.uuid4()),
+                    uploaded_at=uploaded_at,
+                )
+
+        with explicit_upload_times():
+            self.bulk_create(UploadedFile, files())
+        self.report(f'Created {count} files')
+
+    def create_magic_tokens(self, user_ids, per_user):
+        """Give each user per_user tokens: earlier ones used, the latest unused and possibly expired"""
+        now = timezone.now()
+
+        def tokens():
+            for user_id in user_ids:
+                for n in range(per_user):
+                    latest = n == per_user - 1
+                    expired = random.random() < 0.5
+                    yield MagicLoginToken(
+                        user_id=user_id,
+                        token=str(uuid.uuid4()),
+                        is_used=not latest,
+                        expires_at=now + timedelta(hours=-random.randint(1, 24 * 30) if expired else 1),
+                        login_ip='127.0.0.1',
+                        user_agent='generate_test_data',
+                    )
+
+        self.bulk_create(MagicLoginToken, tokens())
+        self.report(f'Created {len(user_ids) * per_user} magic login tokens')
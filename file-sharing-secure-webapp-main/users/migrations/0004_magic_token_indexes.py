@@ -0,0 +1,21 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0003_outboxemail"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="magiclogintoken",
+            index=models.Index(
+                condition=models.Q(("is_used", False)),
+                fields=["user"],
+                name="users_magic_user_unused_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0004_magic_token_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="magiclogintoken",
+            index=models.Index(fields=["expires_at"], name="users_magic_expires_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="magiclogintoken",
+            index=models.Index(fields=["created_at"], name="users_magic_created_idx"),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:24
+
+from django.db import migrations, models
+from django.db.models import Count, F
+from django.db.models.functions import Lower, Trim
+
+
+def populate_email_normalized(apps, schema_editor):
+    CustomUser = apps.get_model("users", "CustomUser")
+    CustomUser.objects.update(email_normalized=Lower(Trim("email")))
+    CustomUser.objects.filter(email_normalized="").update(email_normalized=None)
+
+    # Addresses that differ only in case or whitespace: the account most likely
+    # to be in use keeps the address for lookups, the others get none. Nothing
+    # is deleted; the accounts can still be fixed up in the admin.
+    duplicates = (
+        CustomUser.objects.filter(email_normalized__isnull=False)
+        .values("email_normalized")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+        .values_list("email_normalized", flat=True)
+    )
+    for email in list(duplicates):
+        users = CustomUser.objects.filter(email_normalized=email).order_by(
+            "-is_active",
+            "-email_verified",
+            F("last_login").desc(nulls_last=True),
+            "id",
+        )
+        keeper = users.values_list("id", flat=True).first()
+        users.exclude(id=keeper).update(email_normalized=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0005_magic_token_cleanup_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="email_normalized",
+            field=models.CharField(
+                blank=True, editable=False, max_length=254, null=True
+            ),
+        ),
+        migrations.RunPython(populate_email_normalized, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="customuser",
+            name="email_normalized",
+            field=models.CharField(
+                blank=True, editable=False, max_length=254, null=True, unique=True
+            ),
+        ),
+    ]
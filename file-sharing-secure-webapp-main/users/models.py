@@ -4,10 +4,23 @@ from django.utils import timezone
 from datetime import timedelta
 import uuid
 
+def normalize_email_address(email):
+    """Canonical form of an email address used for lookups and uniqueness"""
+    return (email or '').strip().lower()
+
 class CustomUser(AbstractUser):
     is_ops = models.BooleanField(default=False)
     is_client = models.BooleanField(default=False)
     email_verified = models.BooleanField(default=False)
+    # Lower-cased copy of email, kept in sync by save(); null when email is blank
+    email_normalized = models.CharField(max_length=254, unique=True, null=True, blank=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        self.email_normalized = normalize_email_address(self.email) or None
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'email' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'email_normalized'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.username
@@ -23,6 +36,17 @@ class MagicLoginToken(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # create_magic_login_token() retires a user's unused tokens on every login request
+            models.Index(
+                fields=['user'],
+                name='users_magic_user_unused_idx',
+                condition=models.Q(is_used=False),
+            ),
+            # cleanup_magic_tokens deletes by these two columns
+            models.Index(fields=['expires_at'], name='users_magic_expires_idx'),
+            models.Index(fields=['created_at'], name='users_magic_created_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.expires_at:
@@ -36,3 +60,35 @@ class MagicLoginToken(models.Model):
     def __str__(self):
         return f"Magic token for {self.user.username} - {'Valid' if self.is_valid() else 'Invalid'}"
 
+class OutboxEmail(models.Model):
+    """An email queued by a request and delivered by the send_outbox worker"""
+    PENDING = 'pending'
+    SENT = 'sent'
+    DEAD = 'dead'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (DEAD, 'Dead'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=255)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    # Not picked up before this time; pushed back after each failure and while a worker holds the row
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['next_attempt_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='users_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.recipients)} ({self.status})"
@@ -0,0 +1,135 @@
+"""Durable email outbox.
+
+Requests call enqueue_email(), which only inserts a row, so they never wait
+on SMTP. The send_outbox management command calls deliver_batch() to send due
+messages over one SMTP connection (or the pool of PooledSMTPBackend), retrying failures with exponential
+backoff and marking a message dead after EMAIL_OUTBOX_MAX_ATTEMPTS.
+"""
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+from monitoring.metrics import EMAIL_SEND_DURATION
+from .models import OutboxEmail
+
+import datetime
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_email(subject, message, recipient_list, html_message=None, from_email=None):
+    """Queue an email for the outbox worker and return the OutboxEmail row"""
+    return OutboxEmail.objects.create(
+        subject=subject,
+        body=message,
+        html_body=html_message or '',
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipient_list),
+    )
+
+
+def retry_delay(attempts):
+    """Backoff before the next try after the given number of failed attempts"""
+    seconds = settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+    return datetime.timedelta(seconds=min(seconds, settings.EMAIL_OUTBOX_MAX_RETRY_DELAY))
+
+
+def claim_batch(batch_size):
+    """Lease up to batch_size due messages to this worker.
+
+    The rows' next_attempt_at is pushed past the SMTP timeout, so another
+    worker polling meanwhile skips them; if this worker dies, they become due
+    again once the lease runs out.
+    """
+    now = timezone.now()
+    lease_until = now + datetime.timedelta(seconds=settings.EMAIL_OUTBOX_LEASE)
+    with transaction.atomic():
+        emails = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxEmail.PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        OutboxEmail.objects.filter(pk__in=[email.pk for email in emails]).update(next_attempt_at=lease_until)
+    return emails
+
+
+def build_message(email, connection):
+    message = EmailMultiAlternatives(
+        subject=email.subject,
+        body=email.body,
+        from_email=email.from_email,
+        to=email.recipients,
+        connection=connection,
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+
+def record_failure(email, error):
+    email.attempts += 1
+    email.last_error = error
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = OutboxEmail.DEAD
+        logger.error("Giving up on outbox email %s after %s attempts: %s", email.pk, email.attempts, error)
+    else:
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+    email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def deliver_batch(batch_size=None):
+    """Send one batch of due messages. Returns (sent, failed) counts."""
+    emails = claim_batch(batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE)
+    if not emails:
+        return 0, 0
+
+    sent = failed = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        # The server is unreachable; nothing in this batch can go out
+        for email in emails:
+            record_failure(email, f"Could not connect: {e}")
+        return 0, len(emails)
+
+    try:
+        messages = [build_message(email, connection) for email in emails]
+        if hasattr(connection, 'send_batch'):
+            # The pooled backend sends the batch concurrently over its connections
+            errors = connection.send_batch(messages)
+        else:
+            errors = [send_message(message) for message in messages]
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    for email, error in zip(emails, errors):
+        if error is not None:
+            record_failure(email, str(error))
+            failed += 1
+        else:
+            email.attempts += 1
+            email.status = OutboxEmail.SENT
+            email.sent_at = timezone.now()
+            email.last_error = ''
+            email.save(update_fields=['attempts', 'status', 'sent_at', 'last_error'])
+            sent += 1
+
+    return sent, failed
+
+
+def send_message(message):
+    """Send a message, returning None on success or the exception raised"""
+    start = time.perf_counter()
+    try:
+        message.send()
+    except Exception as e:
+        EMAIL_SEND_DURATION.labels('failed').observe(time.perf_counter() - start)
+        return e
+    EMAIL_SEND_DURATION.labels('sent').observe(time.perf_counter() - start)
+    return None
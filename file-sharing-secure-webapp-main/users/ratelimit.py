@@ -0,0 +1,101 @@
+"""Sliding-window rate limiting for the login, magic-link and signup endpoints.
+
+Each limit counts requests in fixed windows held in the Django cache and
+weighs the previous window by how much of it still overlaps the sliding
+window, which approximates a true sliding log with two counters per key.
+Counters are bumped with cache.incr(), which is atomic in the Redis and
+local-memory backends.
+
+Requests over a limit are answered with 429 before the view runs, so they
+cost a couple of cache operations and no database or SMTP work.
+"""
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from .models import normalize_email_address
+from .utils import get_client_ip
+
+import hashlib
+import math
+import time
+
+
+def hit(key, limit, window):
+    """Count one request against key; return seconds to wait if it is over the limit, else 0"""
+    now = time.time()
+    current = int(now // window)
+    current_key = f"ratelimit:{key}:{current}"
+    previous_key = f"ratelimit:{key}:{current - 1}"
+
+    # Counters live for two windows so the next window can still weigh this one
+    cache.add(current_key, 0, timeout=window * 2)
+    try:
+        count = cache.incr(current_key)
+    except ValueError:
+        # Expired between add() and incr()
+        cache.set(current_key, 1, timeout=window * 2)
+        count = 1
+    previous = cache.get(previous_key, 0)
+
+    elapsed = (now % window) / window
+    if previous * (1 - elapsed) + count <= limit:
+        return 0
+    return math.ceil(window - now % window)
+
+
+def hashed(value):
+    # Keeps keys short and free of characters some cache backends reject
+    return hashlib.sha256(value.encode()).hexdigest()[:32]
+
+
+def request_account(request, field):
+    """The submitted email address or username, normalized, or ''"""
+    data = request.data if hasattr(request, 'data') else request.POST
+    try:
+        return normalize_email_address(data.get(field))
+    except AttributeError:
+        return ''
+
+
+def too_many_requests(request, retry_after):
+    message = "Too many requests. Please wait a few minutes and try again."
+    if hasattr(request, 'data'):
+        response = JsonResponse({"detail": message}, status=429)
+    else:
+        response = HttpResponse(message, status=429, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def rate_limit(scope):
+    """Limit POSTs to a view per client IP and per submitted account.
+
+    The limits are settings.RATE_LIMITS[scope], in requests per ``window``
+    seconds: ``per_ip``, and optionally ``per_account`` for one account
+    (the ``account_field`` POST field, 'email' by default) from one IP and
+    ``per_account_total`` for one account from all IPs. The total is
+    higher, so one client cannot lock someone else out of their account.
+    Works on function views and, through method_decorator, on APIView
+    methods. GET requests are never counted.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'POST' or not settings.RATE_LIMIT_ENABLED:
+                return view(request, *args, **kwargs)
+
+            limits = settings.RATE_LIMITS[scope]
+            window = limits['window']
+            ip = get_client_ip(request) or ''
+            retry_after = hit(f"{scope}:ip:{hashed(ip)}", limits['per_ip'], window)
+            account = request_account(request, limits.get('account_field', 'email'))
+            if account and not retry_after and limits.get('per_account'):
+                retry_after = hit(f"{scope}:account:{hashed(f'{account} {ip}')}", limits['per_account'], window)
+            if account and not retry_after and limits.get('per_account_total'):
+                retry_after = hit(f"{scope}:account:{hashed(account)}", limits['per_account_total'], window)
+            if retry_after:
+                return too_many_requests(request, retry_after)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
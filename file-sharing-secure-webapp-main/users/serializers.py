@@ -1,22 +1,26 @@
 from rest_framework import serializers
-from .models import CustomUser
+from .models import CustomUser, normalize_email_address
 from django.contrib.auth import authenticate
 
 class ClientSignupSerializer(serializers.ModelSerializer):
     class Meta:
         model = CustomUser
         fields = ['username', 'email', 'password']
-        extra_kwargs = {'password': {'write_only': True}}
+        extra_kwargs = {'password': {'write_only': True}, 'email': {'required': True, 'allow_blank': False}}
+
+    def validate_email(self, value):
+        if CustomUser.objects.filter(email_normalized=normalize_email_address(value)).exists():
+            raise serializers.ValidationError("A user with this email address already exists.")
+        return value
 
     def create(self, validated_data):
         user = CustomUser.objects.create_user(
             username=validated_data['username'],
             email=validated_data['email'],
             password=validated_data['password'],
-            is_client=True
+            is_client=True,
+            is_active=False  # Require email verification
         )
-        user.is_active = False  # Require email verification
-        user.save()
         return user
 
 class LoginSerializer(serializers.Serializer):
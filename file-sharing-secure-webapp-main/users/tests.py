@@ -1,3 +1,150 @@
-from django.test import TestCase
+from unittest import mock
+from django.core.cache import cache
+from django.core.mail import EmailMessage
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from .email_backends import PooledSMTPBackend
+from .models import CustomUser, MagicLoginToken
+from .token_stores import get_token_store
+from .utils import create_magic_login_token, validate_magic_token
 
-# Create your tests here.
+import io
+import smtplib
+
+
+class TokenStoreTests:
+    """Behaviour every MAGIC_TOKEN_STORE must share; subclasses pick the store"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username='client', email='client@example.com', is_client=True)
+        self.store = get_token_store()
+
+    def test_create_and_redeem(self):
+        token = self.store.create(self.user, '127.0.0.1', 'tests').token
+        self.assertEqual(self.store.redeem(token), self.user.pk)
+
+    def test_redeem_twice(self):
+        token = self.store.create(self.user, '127.0.0.1', 'tests').token
+        self.assertEqual(self.store.redeem(token), self.user.pk)
+        self.assertIsNone(self.store.redeem(token))
+
+    def test_expired(self):
+        with override_settings(MAGIC_TOKEN_LIFETIME=-1):
+            token = self.store.create(self.user, '127.0.0.1', 'tests').token
+        self.assertIsNone(self.store.redeem(token))
+
+    def test_unknown_token(self):
+        self.assertIsNone(self.store.redeem('not-a-token'))
+
+    def test_new_token_retires_previous(self):
+        first = self.store.create(self.user, '127.0.0.1', 'tests').token
+        second = self.store.create(self.user, '127.0.0.1', 'tests').token
+        self.assertIsNone(self.store.redeem(first))
+        self.assertEqual(self.store.redeem(second), self.user.pk)
+
+    def test_create_and_validate_magic_token(self):
+        request = RequestFactory().get('/', HTTP_USER_AGENT='tests')
+        magic_token = create_magic_login_token(self.user, request)
+        self.assertIsInstance(magic_token, MagicLoginToken)
+        self.assertEqual(magic_token.user, self.user)
+
+        token, error = validate_magic_token(magic_token.token)
+        self.assertIsNone(error)
+        self.assertEqual(token.user, self.user)
+        token, error = validate_magic_token(magic_token.token)
+        self.assertIsNone(token)
+        self.assertTrue(error)
+
+
+@override_settings(MAGIC_TOKEN_STORE='users.token_stores.DatabaseTokenStore')
+class DatabaseTokenStoreTests(TokenStoreTests, TestCase):
+    def test_failure_reasons(self):
+        token = self.store.create(self.user, '127.0.0.1', 'tests').token
+        self.store.redeem(token)
+        self.assertIn('already been used', self.store.failure_reason(token))
+        with override_settings(MAGIC_TOKEN_LIFETIME=-1):
+            expired = self.store.create(self.user, '127.0.0.1', 'tests').token
+        self.assertIn('expired', self.store.failure_reason(expired))
+
+
+@override_settings(MAGIC_TOKEN_STORE='users.token_stores.CacheTokenStore', MAGIC_TOKEN_AUDIT=False)
+class CacheTokenStoreTests(TokenStoreTests, TestCase):
+    pass
+
+
+class FakeSMTP:
+    """Stands in for smtplib.SMTP; refuses refused@example.com and can drop the connection"""
+
+    def __init__(self, host, port, **kwargs):
+        self.sent = []
+        self.closed = False
+        self.disconnect_next = False
+        self.connections.append(self)
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        if self.disconnect_next:
+            self.disconnect_next = False
+            raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        if 'refused@example.com' in to_addrs:
+            raise smtplib.SMTPRecipientsRefused({'refused@example.com': (550, b'No such user')})
+        self.sent.append(to_addrs)
+        return {}
+
+    def quit(self):
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+
+@override_settings(EMAIL_POOL_SIZE=1, EMAIL_SEND_RETRIES=3, EMAIL_RETRY_DELAY=0)
+class PooledSMTPBackendTests(SimpleTestCase):
+    def setUp(self):
+        FakeSMTP.connections = []
+        patcher = mock.patch('django.core.mail.backends.smtp.smtplib.SMTP', FakeSMTP)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(PooledSMTPBackend.close_pools)
+        self.backend = PooledSMTPBackend(
+            host='smtp.example.com', port=25, username='', password='', use_tls=False, use_ssl=False
+        )
+
+    def message(self, to):
+        return EmailMessage('Subject', 'Body', 'from@example.com', [to])
+
+    def test_refused_recipient_keeps_connection(self):
+        with self.assertRaises(smtplib.SMTPRecipientsRefused):
+            self.backend.send_messages([self.message('refused@example.com')])
+        self.assertEqual(self.backend.send_messages([self.message('ok@example.com')]), 1)
+
+        # Not retried, and sent over the same, still open connection
+        self.assertEqual(len(FakeSMTP.connections), 1)
+        self.assertFalse(FakeSMTP.connections[0].closed)
+        self.assertEqual(FakeSMTP.connections[0].sent, [['ok@example.com']])
+
+    def test_disconnect_reconnects(self):
+        self.backend.send_messages([self.message('ok@example.com')])
+        FakeSMTP.connections[0].disconnect_next = True
+        self.assertEqual(self.backend.send_messages([self.message('again@example.com')]), 1)
+
+        self.assertEqual(len(FakeSMTP.connections), 2)
+        self.assertTrue(FakeSMTP.connections[0].closed)
+        self.assertEqual(FakeSMTP.connections[1].sent, [['again@example.com']])
+
+
+class CleanupMagicTokensTests(TestCase):
+    def test_removes_expired_and_old_tokens(self):
+        user = CustomUser.objects.create_user(username='client', email='client@example.com', is_client=True)
+        now = timezone.now()
+        for i in range(5):
+            MagicLoginToken.objects.create(user=user, token=f'expired-{i}', expires_at=now - timezone.timedelta(hours=1))
+        old = MagicLoginToken.objects.create(user=user, token='old', expires_at=now + timezone.timedelta(hours=1))
+        MagicLoginToken.objects.filter(pk=old.pk).update(created_at=now - timezone.timedelta(days=30))
+        MagicLoginToken.objects.create(user=user, token='current', expires_at=now + timezone.timedelta(hours=1))
+
+        out = io.StringIO()
+        call_command('cleanup_magic_tokens', batch_size=2, sleep=0, stdout=out)
+        self.assertIn('Removed 6 ', out.getvalue())
+        self.assertEqual(list(MagicLoginToken.objects.values_list('token', flat=True)), ['current'])
@@ -0,0 +1,168 @@
+"""Where magic login tokens live.
+
+settings.MAGIC_TOKEN_STORE names the store class:
+
+* DatabaseTokenStore keeps tokens as MagicLoginToken rows (the default);
+* CacheTokenStore keeps them in the Django cache, which expires them
+  natively, so the database sees no writes for logins unless
+  MAGIC_TOKEN_AUDIT is on, in which case MagicLoginToken rows are written
+  in the background as an audit trail.
+
+Both redeem a token at most once, even under concurrent requests. Use them
+through create_magic_login_token() and validate_magic_token() in users.utils.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import lru_cache
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connection
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import MagicLoginToken
+
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+INVALID_LINK = "Invalid verification link. Please check the URL or request a new one."
+
+
+def update_returning_supported():
+    """Whether the database can return columns from an UPDATE"""
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 35)
+    return False
+
+
+class DatabaseTokenStore:
+    def create(self, user, login_ip, user_agent):
+        """Issue a new MagicLoginToken for the user, retiring their unused ones"""
+        MagicLoginToken.objects.filter(user=user, is_used=False).update(is_used=True)
+        return MagicLoginToken.objects.create(
+            user=user,
+            token=str(uuid.uuid4()),
+            login_ip=login_ip,
+            user_agent=user_agent,
+            expires_at=timezone.now() + timedelta(seconds=settings.MAGIC_TOKEN_LIFETIME)
+        )
+
+    def redeem(self, token_string):
+        """Mark a valid token used and return its user_id, or None if it was not valid.
+
+        The check and the write are one conditional UPDATE, so when two requests
+        redeem the same link concurrently only one of them gets the user.
+        """
+        now = timezone.now()
+        if update_returning_supported():
+            table = connection.ops.quote_name(MagicLoginToken._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {table} SET is_used = %s "
+                    f"WHERE token = %s AND is_used = %s AND expires_at > %s "
+                    f"RETURNING user_id",
+                    [True, token_string, False, connection.ops.adapt_datetimefield_value(now)]
+                )
+                row = cursor.fetchone()
+            return row[0] if row else None
+
+        # Still race-free, as the UPDATE decides; it just takes a second query for the user_id
+        tokens = MagicLoginToken.objects.filter(token=token_string, is_used=False, expires_at__gt=now)
+        if not tokens.update(is_used=True):
+            return None
+        return MagicLoginToken.objects.filter(token=token_string).values_list('user_id', flat=True).first()
+
+    def failure_reason(self, token_string):
+        """Message explaining why a token could not be redeemed"""
+        token = MagicLoginToken.objects.filter(token=token_string).only('is_used', 'expires_at').first()
+        if token is None:
+            return INVALID_LINK
+        error = "expired" if timezone.now() >= token.expires_at else "already been used"
+        return f"This verification link has {error}. Please request a new one."
+
+
+class CacheTokenStore:
+    # Single background writer: audit rows are best effort and must not slow logins down
+    audit_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='magic-token-audit')
+
+    def token_key(self, token_string):
+        return f"magic-token:{token_string}"
+
+    def user_key(self, user_id):
+        return f"magic-token-user:{user_id}"
+
+    def create(self, user, login_ip, user_agent):
+        """Issue a new token for the user; the MagicLoginToken returned is not saved"""
+        token_string = str(uuid.uuid4())
+        lifetime = settings.MAGIC_TOKEN_LIFETIME
+
+        # Retire the user's previous token, as the database store does
+        previous = cache.get(self.user_key(user.pk))
+        if previous:
+            cache.delete(self.token_key(previous))
+        cache.set_many({
+            self.token_key(token_string): user.pk,
+            self.user_key(user.pk): token_string,
+        }, timeout=lifetime)
+
+        if settings.MAGIC_TOKEN_AUDIT:
+            self.audit(self.write_created, user.pk, token_string, login_ip, user_agent, lifetime)
+        return MagicLoginToken(
+            user=user,
+            token=token_string,
+            login_ip=login_ip,
+            user_agent=user_agent,
+            expires_at=timezone.now() + timedelta(seconds=lifetime)
+        )
+
+    def redeem(self, token_string):
+        key = self.token_key(token_string)
+        user_id = cache.get(key)
+        # delete() reports whether the key existed, and only one caller can remove
+        # it, so this is an atomic get-and-delete across concurrent requests
+        if user_id is None or not cache.delete(key):
+            return None
+
+        if settings.MAGIC_TOKEN_AUDIT:
+            self.audit(self.write_used, token_string)
+        return user_id
+
+    def failure_reason(self, token_string):
+        # Expired and used tokens are both simply gone from the cache
+        return "This verification link is invalid or has expired. Please request a new one."
+
+    def audit(self, function, *args):
+        self.audit_executor.submit(self.run_audit, function, *args)
+
+    def run_audit(self, function, *args):
+        try:
+            function(*args)
+        except Exception:
+            logger.exception("Could not write magic token audit row")
+        finally:
+            # This thread is not a request, so nothing else closes its connection
+            close_old_connections()
+
+    def write_created(self, user_id, token_string, login_ip, user_agent, lifetime):
+        MagicLoginToken.objects.create(
+            user_id=user_id,
+            token=token_string,
+            login_ip=login_ip,
+            user_agent=user_agent,
+            expires_at=timezone.now() + timedelta(seconds=lifetime)
+        )
+
+    def write_used(self, token_string):
+        MagicLoginToken.objects.filter(token=token_string).update(is_used=True)
+
+
+@lru_cache(maxsize=None)
+def load_token_store(path):
+    return import_string(path)()
+
+
+def get_token_store():
+    return load_token_store(settings.MAGIC_TOKEN_STORE)
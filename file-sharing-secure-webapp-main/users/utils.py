@@ -1,21 +1,35 @@
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
 from django.conf import settings
 from django.urls import reverse
 from django.utils import timezone
-from .models import MagicLoginToken
-from .email_utils import send_email_with_retry
-import uuid
+from .models import CustomUser, MagicLoginToken, normalize_email_address
+from .email_rendering import render_email
+from .outbox import enqueue_email
+from .token_stores import INVALID_LINK, get_token_store
 
 def get_client_ip(request):
-    """Get the client's IP address from the request"""
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
-    return ip
+    """Get the client's IP address from the request.
+
+    X-Forwarded-For is only trusted as far as the settings.TRUSTED_PROXY_COUNT
+    proxies in front of Django appended to it; entries further left are
+    whatever the client sent.
+    """
+    proxies = settings.TRUSTED_PROXY_COUNT
+    if proxies:
+        forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR')
+
+def find_user_by_email(email, *conditions, **filters):
+    """Return the user with this email address, ignoring case, or None.
+
+    Extra Q objects and keyword filters narrow the match. The lookup goes
+    through the unique email_normalized index.
+    """
+    email = normalize_email_address(email)
+    if not email:
+        return None
+    return CustomUser.objects.filter(*conditions, email_normalized=email, **filters).first()
 
 def get_user_agent(request):
     """Get the user agent from the request"""
@@ -23,17 +37,8 @@ def get_user_agent(request):
 
 def create_magic_login_token(user, request):
     """Create a magic login token for the user"""
-    # Invalidate any existing unused tokens for this user
-    MagicLoginToken.objects.filter(user=user, is_used=False).update(is_used=True)
-    
-    # Create new token
-    token = MagicLoginToken.objects.create(
-        user=user,
-        token=str(uuid.uuid4()),
-        login_ip=get_client_ip(request),
-        user_agent=get_user_agent(request)
-    )
-    return token
+    # The store also invalidates any existing unused tokens for this user
+    return get_token_store().create(user, get_client_ip(request), get_user_agent(request))
 
 def send_magic_login_email(user, request):
     """Send magic login email to the user"""
@@ -59,35 +64,35 @@ def send_magic_login_email(user, request):
             'user_agent': get_user_agent(request),
         }
         
-        # Render email templates
-        html_message = render_to_string('emails/magic_login.html', context)
-        plain_message = render_to_string('emails/magic_login.txt', context)
+        # Render both parts from the precompiled templates
+        plain_message, html_message = render_email('magic_login', context)
         
-        # Send email with retry mechanism
-        success, message = send_email_with_retry(
+        # Queued for the send_outbox worker so the request never waits on SMTP
+        enqueue_email(
             subject='🔗 Your Verification Login Link - Secure File Share',
             message=plain_message,
             recipient_list=[user.email],
             html_message=html_message,
-            max_retries=3
         )
-        
-        if success:
-            return True, f"Verification login link sent to {user.email}"
-        else:
-            return False, message
+        return True, f"Verification login link sent to {user.email}"
         
     except Exception as e:
         return False, f"Failed to send email: {str(e)}"
 
 def validate_magic_token(token_string):
-    """Validate and return magic login token if valid"""
-    try:
-        token = MagicLoginToken.objects.get(token=token_string)
-        if token.is_valid():
-            return token, None
-        else:
-            error = "expired" if timezone.now() >= token.expires_at else "already used"
-            return None, f"This verification link has {error}. Please request a new one."
-    except MagicLoginToken.DoesNotExist:
-        return None, "Invalid verification link. Please check the URL or request a new one."
+    """Validate and return magic login token if valid.
+
+    A valid token is marked used in the same step, so a link logs in at most
+    once even when it is opened twice at the same time. The token returned
+    carries the token string and its user.
+    """
+    store = get_token_store()
+    user_id = store.redeem(token_string)
+    if user_id is None:
+        # Only failed redemptions pay for working out why
+        return None, store.failure_reason(token_string)
+
+    user = CustomUser.objects.filter(id=user_id).first()
+    if user is None:
+        return None, INVALID_LINK
+    return MagicLoginToken(user=user, token=token_string, is_used=True), None
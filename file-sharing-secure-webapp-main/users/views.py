@@ -1,19 +1,24 @@
 from django.shortcuts import render, redirect
-from django.contrib.auth import authenticate, login, logout
+from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from files.models import UploadedFile
+from files.upload_handlers import StreamingUploadHandler
+from files.validators import validate_upload
 from django.urls import reverse
 from django.contrib import messages
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.db import models
+from monitoring.query_budget import query_budget
 from .forms import OpsUserRegistrationForm, ClientUserRegistrationForm
-from .utils import send_magic_login_email, validate_magic_token
+from .ratelimit import rate_limit
+from .outbox import enqueue_email
+from .utils import send_magic_login_email, validate_magic_token, find_user_by_email
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status
-from .models import CustomUser
+from rest_framework.permissions import AllowAny
 from .serializers import ClientSignupSerializer, LoginSerializer
-from django.core.mail import send_mail
 from django.conf import settings
 from itsdangerous import URLSafeTimedSerializer
 from rest_framework.authtoken.models import Token
@@ -23,37 +28,54 @@ serializer = URLSafeTimedSerializer(settings.SECRET_KEY)
 # -----------------------------
 # ✅ API Views
 # -----------------------------
+@query_budget(6)
 class ClientSignupView(APIView):
+    # Used before the client has a token
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    @method_decorator(rate_limit('signup'))
     def post(self, request):
-        serializer = ClientSignupSerializer(data=request.data)
-        if serializer.is_valid():
-            user = serializer.save()
+        signup = ClientSignupSerializer(data=request.data)
+        if signup.is_valid():
+            user = signup.save()
             token = serializer.dumps(user.email, salt='email-verify')
-            link = f"http://localhost:8000/api/verify-email/{token}/"
-            send_mail(
+            link = request.build_absolute_uri(reverse('verify_email', kwargs={'token': token}))
+            enqueue_email(
                 subject="Verify your email",
                 message=f"Click here to verify your email: {link}",
-                from_email=settings.DEFAULT_FROM_EMAIL,
                 recipient_list=[user.email]
             )
             return Response({"message": "Verification email sent", "verification_link": link})
-        return Response(serializer.errors, status=400)
+        return Response(signup.errors, status=400)
 
+@query_budget(4)
 class VerifyEmailView(APIView):
+    # Used before the client has a token
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
     def get(self, request, token):
         try:
             email = serializer.loads(token, salt='email-verify', max_age=3600)
-            user = CustomUser.objects.get(email=email)
-            user.is_active = True
-            user.email_verified = True
-            user.save()
-            return Response({"message": "Email verified successfully"})
-        except CustomUser.DoesNotExist:
-            return Response({"error": "No user found for email"}, status=404)
         except Exception as e:
             return Response({"error": "Invalid or expired token"}, status=400)
 
+        user = find_user_by_email(email)
+        if user is None:
+            return Response({"error": "No user found for email"}, status=404)
+        user.is_active = True
+        user.email_verified = True
+        user.save()
+        return Response({"message": "Email verified successfully"})
+
+@query_budget(5)
 class LoginView(APIView):
+    # Used before the client has a token
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    @method_decorator(rate_limit('api_login'))
     def post(self, request):
         serializer = LoginSerializer(data=request.data)
         if serializer.is_valid():
@@ -66,10 +88,12 @@ class LoginView(APIView):
 # ✅ Web Views (Template-based)
 # -----------------------------
 
+@query_budget(2)
 def home(request):
     """Home page with navigation options"""
     return render(request, 'home.html')
 
+@query_budget(2, post=6)
 def ops_register(request):
     """Registration form for operations users"""
     if request.method == 'POST':
@@ -82,6 +106,7 @@ def ops_register(request):
         form = OpsUserRegistrationForm()
     return render(request, 'register_ops.html', {'form': form})
 
+@query_budget(2, post=6)
 def client_register(request):
     """Registration form for client users"""
     if request.method == 'POST':
@@ -94,6 +119,8 @@ def client_register(request):
         form = ClientUserRegistrationForm()
     return render(request, 'register_client.html', {'form': form})
 
+@query_budget(2, post=8)
+@rate_limit('login')
 def user_login(request):
     """General login view - Verification link only"""
     if request.method == 'POST':
@@ -105,12 +132,11 @@ def user_login(request):
         
         try:
             # Find user by email (both ops and client users)
-            user = CustomUser.objects.filter(
-                email=email, 
+            user = find_user_by_email(
+                email,
+                models.Q(is_client=True) | models.Q(is_ops=True),
                 is_active=True
-            ).filter(
-                models.Q(is_client=True) | models.Q(is_ops=True)
-            ).first()
+            )
             
             if user:
                 success, message = send_magic_login_email(user, request)
@@ -129,23 +155,43 @@ def user_login(request):
     
     return render(request, 'login.html')
 
+@query_budget(5)
 def user_logout(request):
     logout(request)
     return redirect('login')
 
+@query_budget(3, post=12)
+@csrf_exempt
 @login_required
 def dashboard_ops(request):
     if not request.user.is_ops:
         return redirect('login')
-    
-    if request.method == 'POST' and request.FILES.get('file'):
-        f = request.FILES['file']
-        if f.name.endswith(('.docx', '.pptx', '.xlsx')):
-            UploadedFile.objects.create(uploader=request.user, file=f)
 
-    files = UploadedFile.objects.all()
-    return render(request, 'dashboard_ops.html', {'files': files})
+    if request.method == 'POST':
+        # Stream the upload into blob storage; this must happen before the CSRF check reads the body
+        request.upload_handlers = [StreamingUploadHandler(request)]
+    return _dashboard_ops(request)
 
+@csrf_protect
+def _dashboard_ops(request):
+    upload_error = None
+    if request.method == 'POST':
+        f = request.FILES.get('file')
+        if f is None:
+            # The upload handler leaves the reason on the request when it rejects a file
+            upload_error = getattr(request, 'upload_error', None) or "No file uploaded"
+        else:
+            upload_error = validate_upload(f.name, f.content_type)
+            if upload_error:
+                f.delete()
+            else:
+                UploadedFile.objects.create_from_upload(request.user, f)
+
+    # The template shows each file's uploader
+    files = UploadedFile.objects.select_related('uploader')
+    return render(request, 'dashboard_ops.html', {'files': files, 'upload_error': upload_error})
+
+@query_budget(3)
 @login_required
 def dashboard_client(request):
     if not request.user.is_client:
@@ -154,6 +200,8 @@ def dashboard_client(request):
     files = UploadedFile.objects.all()
     return render(request, 'dashboard_client.html', {'files': files})
 
+@query_budget(2, post=6)
+@rate_limit('login')
 def ops_login(request):
     """Login view specifically for operations users - Verification link only"""
     if request.method == 'POST':
@@ -165,11 +213,7 @@ def ops_login(request):
         
         try:
             # Find operations user by email
-            user = CustomUser.objects.filter(
-                email=email, 
-                is_active=True,
-                is_ops=True
-            ).first()
+            user = find_user_by_email(email, is_active=True, is_ops=True)
             
             if user:
                 success, message = send_magic_login_email(user, request)
@@ -188,6 +232,8 @@ def ops_login(request):
     
     return render(request, 'login_ops.html')
 
+@query_budget(2, post=6)
+@rate_limit('login')
 def client_login(request):
     """Login view specifically for client users - Verification link only"""
     if request.method == 'POST':
@@ -199,11 +245,7 @@ def client_login(request):
         
         try:
             # Find client user by email
-            user = CustomUser.objects.filter(
-                email=email, 
-                is_active=True,
-                is_client=True
-            ).first()
+            user = find_user_by_email(email, is_active=True, is_client=True)
             
             if user:
                 success, message = send_magic_login_email(user, request)
@@ -222,34 +264,30 @@ def client_login(request):
     
     return render(request, 'login_client.html')
 
+@query_budget(10)
 def magic_login(request, token):
     """Handle verification login from email link"""
+    # Validates and marks the token used in one step, so a link logs in at most once
     magic_token, error = validate_magic_token(token)
     
     if error:
         messages.error(request, error)
         return redirect('home')
     
-    if magic_token:
-        # Mark token as used
-        magic_token.is_used = True
-        magic_token.save()
-        
-        # Log the user in
-        login(request, magic_token.user)
-        messages.success(request, f'Welcome back, {magic_token.user.get_full_name() or magic_token.user.username}! You have been automatically logged in.')
-        
-        # Redirect to appropriate dashboard based on user type
-        if magic_token.user.is_ops:
-            return redirect('dashboard_ops')
-        elif magic_token.user.is_client:
-            return redirect('dashboard_client')
-        else:
-            return redirect('home')
+    # Log the user in
+    login(request, magic_token.user)
+    messages.success(request, f'Welcome back, {magic_token.user.get_full_name() or magic_token.user.username}! You have been automatically logged in.')
     
-    messages.error(request, 'Invalid verification link.')
-    return redirect('home')
+    # Redirect to appropriate dashboard based on user type
+    if magic_token.user.is_ops:
+        return redirect('dashboard_ops')
+    elif magic_token.user.is_client:
+        return redirect('dashboard_client')
+    else:
+        return redirect('home')
 
+@query_budget(2, post=6)
+@rate_limit('login')
 def request_magic_login(request):
     """Allow users to request a verification login link via email"""
     if request.method == 'POST':
@@ -261,12 +299,11 @@ def request_magic_login(request):
         
         try:
             # Support both ops and client users
-            user = CustomUser.objects.filter(
-                email=email, 
+            user = find_user_by_email(
+                email,
+                models.Q(is_client=True) | models.Q(is_ops=True),
                 is_active=True
-            ).filter(
-                models.Q(is_client=True) | models.Q(is_ops=True)
-            ).first()
+            )
             
             if user:
                 success, message = send_magic_login_email(user, request)